@@ -2,9 +2,15 @@ from mr_database.mrdatabase import MrDatabase
 from mr_database.inquisitor import Inquisitor
 from mr_database.databaseconnection import DatabaseConnection, ConType
 from mr_database.table import Table
-from mr_database.records import Records
+from mr_database.records import Records, RowRecords
 from mr_database.mrdatabase import LogLevel
 from mr_database.column import Column
 from mr_database.column import DataTypes
+from mr_database.pragmaprofile import PragmaProfile
+from mr_database.compression import Codecs
+from mr_database.blobstore import BlobStore
+from mr_database.changelog import ChangeLog
+from mr_database.session import Session
+from mr_database.querycache import QueryCache
 
 name = 'mrdatabase'
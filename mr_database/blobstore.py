@@ -0,0 +1,47 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+from typing import Tuple
+
+from mr_database.column import Column, DataTypes
+from mr_database.table import Table
+
+
+class BlobStore(Table):
+    """ Content addressed store for the values of dedup columns (Column(DataTypes.blob, dedup=True)).
+    Rows of the referencing tables hold the sha256 of the value, each distinct value is stored once.
+    The reference counts are kept up to date by triggers on the referencing tables """
+
+    contentHash = Column(DataTypes.char(64), pk=True)
+    refCount = Column(DataTypes.integer, default=0, not_null=True)
+    byteSize = Column(DataTypes.integer)
+    blobData = Column(DataTypes.blob, deferred=True)
+
+    # new values start unreferenced, the insert triggers of the referencing rows count them
+    ingest = 'INSERT OR IGNORE INTO BlobStore(contentHash, refCount, byteSize, blobData) VALUES (?, 0, ?, ?);'
+    select_data = 'SELECT blobData FROM BlobStore WHERE contentHash=?;'
+    collect = 'DELETE FROM BlobStore WHERE refCount <= 0;'
+
+    @staticmethod
+    def triggers(table_name: str, col_name: str) -> Tuple[str]:
+        """ Returns the statements creating the triggers, which count the references of a dedup column """
+
+        increment = f'UPDATE BlobStore SET refCount = refCount + 1 WHERE contentHash = NEW.{col_name};'
+        decrement = f'UPDATE BlobStore SET refCount = refCount - 1 WHERE contentHash = OLD.{col_name};'
+
+        return (f'CREATE TRIGGER IF NOT EXISTS {table_name}_{col_name}_blob_insert AFTER INSERT ON {table_name} '
+                f'WHEN NEW.{col_name} IS NOT NULL BEGIN {increment} END;',
+
+                f'CREATE TRIGGER IF NOT EXISTS {table_name}_{col_name}_blob_update AFTER UPDATE OF {col_name} ON {table_name} '
+                f'WHEN NEW.{col_name} IS NOT OLD.{col_name} BEGIN {increment} {decrement} END;',
+
+                f'CREATE TRIGGER IF NOT EXISTS {table_name}_{col_name}_blob_delete AFTER DELETE ON {table_name} '
+                f'WHEN OLD.{col_name} IS NOT NULL BEGIN {decrement} END;')
+
+    @staticmethod
+    def release(table_name: str, col_name: str) -> str:
+        """ Returns the statement releasing all references of a dedup column, before its table is dropped """
+
+        return f'UPDATE BlobStore SET refCount = refCount - ' \
+               f'(SELECT count(*) FROM {table_name} WHERE {table_name}.{col_name} = BlobStore.contentHash) ' \
+               f'WHERE contentHash IN (SELECT {col_name} FROM {table_name});'
@@ -0,0 +1,29 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+from typing import Tuple
+
+from mr_database.column import Column, DataTypes
+from mr_database.table import Table
+
+
+class ChangeLog(Table):
+    """ A change counter per table, incremented by triggers on every inserted, updated or deleted row.
+    Any connection, in any process, can compare the counters to find out which tables changed """
+
+    tableName = Column(DataTypes.varchar(64), pk=True)
+    version = Column(DataTypes.integer, default=0, not_null=True)
+
+    register = 'INSERT OR IGNORE INTO ChangeLog(tableName, version) VALUES (?, 0);'
+    select_versions = 'SELECT tableName, version FROM ChangeLog;'
+    increment = 'UPDATE ChangeLog SET version = version + 1 WHERE tableName=?;'
+
+    @staticmethod
+    def triggers(table_name: str) -> Tuple[str]:
+        """ Returns the statements creating the triggers, which count the changes of a table """
+
+        increment = f"UPDATE ChangeLog SET version = version + 1 WHERE tableName = '{table_name}';"
+
+        return tuple(f'CREATE TRIGGER IF NOT EXISTS {table_name}_changelog_{action.lower()} AFTER {action} ON {table_name} '
+                     f'BEGIN {increment} END;'
+                     for action in ('INSERT', 'UPDATE', 'DELETE'))
@@ -1,6 +1,10 @@
 #!/usr/bin/python3
 # -*- coding: utf-8 -*-
 
+import hashlib
+
+from mr_database.compression import Codecs
+
 
 class DataTypes:
 
@@ -22,6 +26,10 @@ class DataTypes:
     datetime = 'DATETIME'
     blob = 'BLOB'
 
+    # values are compressed when written and decompressed when the attribute is first accessed
+    compressed_blob = 'COMPRESSED_BLOB'
+    compressed_text = 'COMPRESSED_TEXT'
+
 
 class Column:
 
@@ -35,7 +43,12 @@ class Column:
                  fk: 'Table.__subclasses__'=None,
                  unique: bool=False,
                  not_null: bool=False,
-                 display_name: str=None):
+                 display_name: str=None,
+                 deferred: bool=False,
+                 codec: str=Codecs.zlib,
+                 level: int=None,
+                 threshold: int=64,
+                 dedup: bool=False):
 
         self.data_type = data_type
         self.data_type_var = data_type_var
@@ -60,6 +73,66 @@ class Column:
 
         self.display_name = display_name
 
+        # deferred columns are not selected by default, but loaded when the attribute is first accessed
+        self.deferred = deferred
+        self.name: str = None
+
+        # compressed columns only, values smaller than threshold bytes are stored raw
+        self.codec: str = Codecs.validate(codec)
+        self.level: int = level
+        self.threshold: int = threshold
+
+        # dedup columns store a content hash, the value itself is stored once in the BlobStore table
+        self.dedup = dedup
+
+    @property
+    def is_compressed(self) -> bool:
+        return self.data_type in (DataTypes.compressed_blob, DataTypes.compressed_text)
+
+    @staticmethod
+    def content_hash(value) -> str:
+        """ The key of a dedup column value in the BlobStore table """
+
+        if isinstance(value, str):
+            value = value.encode('utf-8')
+
+        return hashlib.sha256(value).hexdigest()
+
+    def to_sql(self, value):
+        """ Converts an attribute value to the value stored in the database """
+
+        if value is None or not self.is_compressed:
+            return value
+
+        if isinstance(value, str):
+            value = value.encode('utf-8')
+
+        return Codecs.compress(value, self.codec, self.level, self.threshold)
+
+    def from_sql(self, value):
+        """ Converts a value stored in the database back to the attribute value """
+
+        if value is None or not self.is_compressed:
+            return value
+
+        value = Codecs.decompress(value)
+
+        if self.data_type == DataTypes.compressed_text:
+            return value.decode('utf-8')
+
+        return value
+
+    def __set_name__(self, owner, name: str) -> None:
+        self.name = name
+
+    def __get__(self, instance, owner):
+        """ Only called when the record has no value for the column, e.g. a deferred or unselected column """
+
+        if instance is None:
+            return self
+
+        return instance.__load_column__(self.name)
+
     def __len__(self):
         pass
 
@@ -0,0 +1,78 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import array
+from typing import Dict, List, Optional, Sequence, Union
+
+from mr_database.column import Column, DataTypes
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class ColumnBuffer:
+    """ Collects the values of one column from cursor chunks, for MrDatabase.select_columns.
+    Integer columns are collected in an int64 array. If they hold NULL, they turn into a float64 array
+    with NaN for NULL (and into a list if they hold text). Other columns are collected in a list,
+    which turns into a NumPy object array """
+
+    # data type: array typecode (int64)
+    typecodes: Dict[str, str] = {DataTypes.integer: 'q', DataTypes.smallint: 'q'}
+
+    def __init__(self, column: Column):
+        self.typecode: Optional[str] = self.typecodes.get(column.data_type)
+        self.values: Union[array.array, List] = array.array(self.typecode) if self.typecode else list()
+
+        # the values as selected, once they are kept as float64. The int64 array, then the chunks since
+        self.__exact_values__: Optional[List] = None
+
+    def extend(self, values: Sequence) -> None:
+
+        if self.typecode is None:
+            self.values.extend(values)
+            return
+
+        size = len(self.values)
+
+        try:
+            if self.typecode == 'q':
+                self.values.extend(values)
+            else:
+                self.values.extend(float('nan') if value is None else value for value in values)
+                self.__exact_values__.append(values)
+        except (TypeError, OverflowError):
+            # array.extend keeps the values before the one failing
+            del self.values[size:]
+            self.__widen__()
+            self.extend(values)
+
+    def __widen__(self) -> None:
+        """ int64 values turn into float64 values, float64 values into a list of the values as selected """
+
+        if self.typecode == 'q':
+            self.typecode = 'd'
+            self.__exact_values__ = [self.values]
+            self.values = array.array('d', self.values)
+        else:
+            self.typecode = None
+            self.values = [value for values in self.__exact_values__ for value in values]
+            self.__exact_values__ = None
+
+    def to_array(self):
+        """ Returns a NumPy array if NumPy is installed, otherwise the array.array or list of the values """
+
+        if numpy is None:
+            return self.values
+
+        if self.typecode == 'q':
+            return numpy.frombuffer(self.values, dtype=numpy.int64)
+
+        if self.typecode == 'd':
+            return numpy.frombuffer(self.values, dtype=numpy.float64)
+
+        values = numpy.empty(len(self.values), dtype=object)
+        values[:] = self.values
+
+        return values
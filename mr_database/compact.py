@@ -0,0 +1,163 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+Compact table classes, which store their records in __slots__ instead of an instance __dict__
+
+class City(Table, compact=True):
+    id = Column(DataTypes.integer, pk=True)
+
+Records of compact classes take considerably less memory, but can not hold attributes other than their columns
+
+"""
+
+from typing import Dict, Generator, Mapping, Tuple
+
+from mr_database.column import Column
+
+
+class SlotColumn:
+    """ Replaces the Column of a compact table class. Stores the value of the column in a slot of the record """
+
+    __slots__ = ('column', 'name', 'member')
+
+    def __init__(self, column: Column, name: str, member):
+        self.column: Column = column
+        self.name: str = name
+        self.member = member
+
+    def __get__(self, instance, owner):
+
+        if instance is None:
+            return self.column
+
+        try:
+            return self.member.__get__(instance, owner)
+        except AttributeError:
+            return instance.__load_column__(self.name)
+
+    def __set__(self, instance, value) -> None:
+        self.member.__set__(instance, value)
+
+    def __delete__(self, instance) -> None:
+        self.member.__delete__(instance)
+
+
+class StateAttribute:
+    """ Record state (e.g. __dirty__) of a compact record. All state is kept in one dict in the __state__ slot,
+    which only exists while any state is set. Reads None until set, like the class level default """
+
+    __slots__ = ('name', 'member')
+
+    def __init__(self, name: str, member):
+        self.name: str = name
+        self.member = member
+
+    def __get__(self, instance, owner):
+
+        if instance is None:
+            return None
+
+        try:
+            return self.member.__get__(instance, owner).get(self.name)
+        except AttributeError:
+            return None
+
+    def __set__(self, instance, value) -> None:
+
+        try:
+            state = self.member.__get__(instance, None)
+        except AttributeError:
+            if value is None:
+                return
+
+            state = dict()
+            self.member.__set__(instance, state)
+
+        if value is not None:
+            state[self.name] = value
+            return
+
+        state.pop(self.name, None)
+
+        if not state:
+            self.member.__delete__(instance)
+
+
+class CompactRecord:
+    """ Mixin of compact table classes. Looks up column values in the slots instead of the instance __dict__ """
+
+    __slots__ = ()
+
+    # the record state, see Table
+    __state_names__: Tuple[str] = ('__dirty__', '__database__', '__encoded__', '__blob_hashes__', '__join_tables__')
+
+    # column name: slot member
+    __column_slots__: Mapping = dict()
+
+    def __has_value__(self, col_name: str) -> bool:
+
+        try:
+            self.__column_slots__[col_name].__get__(self, None)
+        except AttributeError:
+            return False
+
+        return True
+
+    def __peek_value__(self, col_name: str):
+
+        try:
+            return self.__column_slots__[col_name].__get__(self, None)
+        except AttributeError:
+            return None
+
+    def __drop_value__(self, col_name: str) -> None:
+
+        try:
+            self.__column_slots__[col_name].__delete__(self)
+        except AttributeError:
+            pass
+
+    def get_attributes(self) -> Generator[str, None, None]:
+        """ returns the names of the columns holding a value """
+
+        return (col_name for col_name in self.__column_slots__ if self.__has_value__(col_name))
+
+
+class TableMeta(type):
+    """ Metaclass of Table. Builds the __slots__ of table classes defined with compact=True """
+
+    def __new__(mcs, name: str, bases: Tuple[type], namespace: Dict, compact: bool=False, **kwargs):
+
+        if not compact:
+            return super().__new__(mcs, name, bases, namespace, **kwargs)
+
+        col_names = tuple(attr for attr, value in namespace.items() if isinstance(value, Column))
+        slot_names = {col_name: f'__{col_name}_value__' for col_name in col_names}
+
+        is_compact = any(issubclass(base, CompactRecord) for base in bases)
+        state_names = () if is_compact else CompactRecord.__state_names__
+
+        namespace = dict(namespace)
+        # the record state shares one slot, mostly empty
+        namespace['__slots__'] = tuple(namespace.get('__slots__', ())) + tuple(slot_names.values()) + (('__state__',) if state_names else ())
+
+        if not is_compact:
+            bases = (CompactRecord,) + bases
+
+        # the schema is compiled from the Column objects while the class is created
+        cls = super().__new__(mcs, name, bases, namespace, **kwargs)
+
+        column_slots = dict()
+
+        for col_name, slot_name in slot_names.items():
+            member = cls.__dict__[slot_name]
+            column_slots[col_name] = member
+            setattr(cls, col_name, SlotColumn(namespace[col_name], col_name, member))
+
+        for state_name in state_names:
+            setattr(cls, state_name, StateAttribute(state_name, cls.__dict__['__state__']))
+
+        cls.__column_slots__ = column_slots
+
+        return cls
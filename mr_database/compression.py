@@ -0,0 +1,55 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import bz2 as bz2_codec
+import lzma as lzma_codec
+import zlib as zlib_codec
+from typing import Callable, Dict, Tuple
+
+
+class Codecs:
+    """ Compression codecs for compressed columns. Stored values start with a one byte codec id """
+
+    raw = 'raw'
+    zlib = 'zlib'
+    lzma = 'lzma'
+    bz2 = 'bz2'
+
+    default_levels: Dict[str, int] = {zlib: 6, lzma: 6, bz2: 9}
+
+    # codec name: (codec id, compress(data, level), decompress(data))
+    __codecs__: Dict[str, Tuple[int, Callable, Callable]] = {
+        raw: (0, lambda data, level: data, lambda data: data),
+        zlib: (1, lambda data, level: zlib_codec.compress(data, level), zlib_codec.decompress),
+        lzma: (2, lambda data, level: lzma_codec.compress(data, preset=level), lzma_codec.decompress),
+        bz2: (3, lambda data, level: bz2_codec.compress(data, compresslevel=level), bz2_codec.decompress),
+    }
+
+    __decompressors__: Dict[int, Callable] = {codec_id: decompress for codec_id, _, decompress in __codecs__.values()}
+
+    @classmethod
+    def validate(cls, codec: str) -> str:
+
+        if codec not in cls.__codecs__:
+            raise ValueError(f'Unknown codec: {codec}. Choose from {", ".join(cls.__codecs__)}')
+
+        return codec
+
+    @classmethod
+    def compress(cls, data: bytes, codec: str, level: int=None, threshold: int=0) -> bytes:
+        """ Compresses data, prefixed by the codec id. Data smaller than threshold, or data which does not
+        get smaller when compressed, is stored raw """
+
+        if len(data) >= threshold:
+            codec_id, compress, _ = cls.__codecs__[codec]
+            compressed = compress(data, cls.default_levels.get(codec) if level is None else level)
+
+            if len(compressed) < len(data):
+                return bytes((codec_id,)) + compressed
+
+        return b'\x00' + data
+
+    @classmethod
+    def decompress(cls, stored: bytes) -> bytes:
+
+        return cls.__decompressors__[stored[0]](bytes(stored[1:]))
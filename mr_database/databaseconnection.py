@@ -1,6 +1,3 @@
-import sqlite3 as sqlite
-
-
 class ConType:
 
     query = 0
@@ -10,28 +7,45 @@ class ConType:
 
 class DatabaseConnection:
 
-    is_batching = False
-
     def __init__(self, database_object: 'MrDatabase', con_type: int=ConType.mutation):
 
         self.database_object = database_object
         self.con_type: int = con_type
+        self.restore_pragmas = None
+        self.is_nested: bool = False
+
+        # the connection opened by this context, and the connection and cursor of an enclosing context
+        self.con = None
+        self.outer_con = None
+        self.outer_cur = None
+
+    @property
+    def is_batching(self) -> bool:
+        """ Batch state belongs to the database object and the current thread """
+
+        return self.database_object.is_batching
 
     def __enter__(self):
 
         if self.con_type == ConType.query:
-            if not DatabaseConnection.is_batching:
+            if not self.is_batching:
                 self.connect()
 
         elif self.con_type == ConType.mutation:
-            if not DatabaseConnection.is_batching:
+            if not self.is_batching:
                 self.connect()
 
         elif self.con_type == ConType.batch:
+            if self.is_batching:
+                # a batch inside a batch joins the enclosing batch
+                self.is_nested = True
+                return
+
             self.connect()
-            DatabaseConnection.is_batching = True
+            self.restore_pragmas = self.database_object.profile.begin_batch(self.con)
+            self.database_object.is_batching = True
 
-    def __exit__(self, *args):
+    def __exit__(self, exc_type, *args):
 
         if self.con_type == ConType.query:
             if not self.is_batching:
@@ -44,16 +58,38 @@ class DatabaseConnection:
                 self.close()
 
         elif self.con_type == ConType.batch:
-            DatabaseConnection.is_batching = False
-            self.commit()
+            if self.is_nested:
+                return
+
+            self.database_object.is_batching = False
+
+            # a batch is one transaction, nothing of it is written if it fails
+            if exc_type is None:
+                self.commit()
+            else:
+                self.rollback()
+
+            self.database_object.profile.end_batch(self.con, self.restore_pragmas)
             self.close()
+            self.database_object.__end_batch__()
 
     def connect(self):
-        self.database_object.con = sqlite.connect(self.database_object.database_path)
-        self.database_object.cur = self.database_object.con.cursor()
+        self.outer_con = self.database_object.con
+        self.outer_cur = self.database_object.cur
+
+        self.con = self.database_object.__connection__()
+        self.database_object.con = self.con
+        self.database_object.cur = self.con.cursor()
 
     def commit(self):
-        self.database_object.con.commit()
+        self.con.commit()
+
+    def rollback(self):
+        self.con.rollback()
 
     def close(self):
-        self.database_object.con.close()
+        self.database_object.__release_connection__(self.con)
+
+        # restoring the enclosing context, e.g. a generator still iterating over its own connection
+        self.database_object.con = self.outer_con
+        self.database_object.cur = self.outer_cur
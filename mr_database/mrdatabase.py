@@ -1,16 +1,45 @@
 #!/usr/bin/python3
 # -*- coding: utf-8 -*-
-from typing import List, Any, Tuple
+from typing import ContextManager, Dict, Generator, Iterable, List, Any, Mapping, Optional, Sequence, Tuple, Union
 
+import base64
+import contextlib
+import hashlib
+import io
+import json
 import logging
 import sqlite3 as sqlite
+import threading
+import time
+import weakref
 
 from mr_database.databaseconnection import DatabaseConnection, ConType
+from mr_database.pragmaprofile import PragmaProfile
+from mr_database.blobstore import BlobStore
+from mr_database.changelog import ChangeLog
+from mr_database.columnar import ColumnBuffer
+from mr_database.querycache import QueryCache
 from mr_database.table import Table
-from mr_database.records import Records
+from mr_database.column import Column
+from mr_database.records import Records, RowRecords
 
 VERSION = '0.9.13'
 
+# parameters bound to a condition. Positional (?) or named (:name)
+Params = Union[Sequence[Any], Mapping[str, Any], None]
+
+# the default upper bound on the number of host parameters in a single sql statement, for older sqlite versions
+SQLITE_MAX_VARIABLES = 999
+
+# the size of the chunks streamed to and from blob columns
+BLOB_CHUNK_SIZE = 1024 * 1024
+
+# blob streaming needs Connection.blobopen, added in Python 3.11
+BLOB_STREAMING = hasattr(sqlite.Connection, 'blobopen')
+
+# the sqlite aggregate functions accepted by MrDatabase.aggregate
+AGGREGATE_FUNCTIONS = ('count', 'sum', 'total', 'avg', 'min', 'max', 'group_concat')
+
 
 class LogLevel:
 
@@ -34,19 +63,140 @@ class MrDatabase:
 
         return VERSION
 
-    def __init__(self, database_path: str):
-        self.con: sqlite.connect = None
-        self.cur: sqlite.Cursor = None
+    def __init__(self, database_path: str, profile: Union[str, Dict[str, Any], PragmaProfile]=None, query_cache: QueryCache=None, track_changes: bool=False):
         self.database_path = database_path
+        self.profile: PragmaProfile = PragmaProfile.resolve(profile)
+
+        # opt-in cache of select results, invalidated per table by every write through this object
+        self.query_cache: Optional[QueryCache] = query_cache
+
+        # tables written by triggers. Their cached results are invalidated with every write
+        self.trigger_table_names: List[str] = [BlobStore.get_table_name()]
+
+        # tables created with track_changes count their changes in the ChangeLog table, so changes made by
+        # other processes invalidate the query cache as well
+        self.track_changes: bool = track_changes
+        self.__table_versions__: Dict[str, int] = dict()
+
+        if track_changes:
+            self.trigger_table_names.append(ChangeLog.get_table_name())
+
+        # connection, cursor and batch state are kept per thread.
+        # long-lived connections are kept per thread as well, while the database is open
+        self.__local__ = threading.local()
+        self.__lock__ = threading.Lock()
+        self.__is_open__ = False
+        self.__persistent_cons__: Dict[threading.Thread, sqlite.Connection] = weakref.WeakKeyDictionary()
+
+    def __deepcopy__(self, memo) -> 'MrDatabase':
+        """ A database is a shared resource. Records referencing it, e.g. for deferred columns, share it when cloned """
+
+        return self
+
+    def __enter__(self) -> 'MrDatabase':
+        return self.open()
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def con(self) -> sqlite.Connection:
+        return getattr(self.__local__, 'con', None)
+
+    @con.setter
+    def con(self, value: sqlite.Connection) -> None:
+        self.__local__.con = value
+
+    @property
+    def cur(self) -> sqlite.Cursor:
+        return getattr(self.__local__, 'cur', None)
+
+    @cur.setter
+    def cur(self, value: sqlite.Cursor) -> None:
+        self.__local__.cur = value
+
+    @property
+    def is_batching(self) -> bool:
+        return getattr(self.__local__, 'is_batching', False)
+
+    @is_batching.setter
+    def is_batching(self, value: bool) -> None:
+        self.__local__.is_batching = value
+
+    def open(self) -> 'MrDatabase':
+        """ Opens long-lived connections (one per thread), reused by all database actions until close() is called """
+
+        self.__is_open__ = True
+
+        return self
+
+    def close(self) -> None:
+        """ Closes the long-lived connections of all threads. Database actions fall back to connect-per-call """
+
+        with self.__lock__:
+            self.__is_open__ = False
+
+            for con in self.__persistent_cons__.values():
+                con.close()
+
+            self.__persistent_cons__.clear()
+
+    def is_open(self) -> bool:
+
+        return self.__is_open__
+
+    def __new_connection__(self, check_same_thread: bool=True) -> sqlite.Connection:
+
+        con = sqlite.connect(self.database_path, check_same_thread=check_same_thread)
+        self.profile.apply(con)
+
+        return con
+
+    def __connection__(self) -> sqlite.Connection:
+        """ Returns the long-lived connection of the current thread if open, otherwise a new connection """
+
+        if not self.__is_open__:
+            return self.__new_connection__()
+
+        thread = threading.current_thread()
+        con = self.__persistent_cons__.get(thread)
+
+        if con is None:
+            # close() may be called from any thread, hence check_same_thread=False
+            con = self.__new_connection__(check_same_thread=False)
+
+            with self.__lock__:
+                self.__persistent_cons__[thread] = con
+
+        return con
+
+    def __release_connection__(self, con: sqlite.Connection) -> None:
+        """ Closes a connection, unless it is the long-lived connection of the current thread """
+
+        if self.__persistent_cons__.get(threading.current_thread()) is not con:
+            con.close()
 
     def create_table(self, table_class: Table.__subclasses__, con_type=ConType.mutation) -> bool:
         try:
 
             with DatabaseConnection(self, con_type=con_type):
-                sql = table_class.__create_table__()
+                sql = table_class.get_statements().create_table
                 logging.info(sql)
 
+                self.__invalidate__(None)
+
                 self.cur.execute(sql)
+
+                if table_class.get_schema().dedup_col_names:
+                    self.cur.execute(BlobStore.get_statements().create_table)
+
+                    for col_name in table_class.get_schema().dedup_col_names:
+                        for trigger in BlobStore.triggers(table_class.get_table_name(), col_name):
+                            self.cur.execute(trigger)
+
+                if self.track_changes:
+                    self.enable_change_tracking(table_class)
+
                 return True
 
         except:
@@ -57,9 +207,21 @@ class MrDatabase:
         try:
 
             with DatabaseConnection(self, con_type=con_type):
-                sql = table_class.__drop_table__()
+                sql = table_class.get_statements().drop_table
                 logging.info(sql)
 
+                self.__invalidate__(None)
+
+                dedup_col_names = table_class.get_schema().dedup_col_names
+
+                if dedup_col_names and self.table_exists(table_class):
+                    # dropping the table does not fire the delete triggers
+                    for col_name in dedup_col_names:
+                        self.cur.execute(BlobStore.release(table_class.get_table_name(), col_name))
+
+                if self.track_changes and self.table_exists(ChangeLog):
+                    self.cur.execute(ChangeLog.increment, (table_class.get_table_name(),))
+
                 self.cur.execute(sql)
                 return True
 
@@ -69,28 +231,181 @@ class MrDatabase:
 
     def table_exists(self, table_class: Table.__subclasses__) -> bool:
 
-        sql = f"SELECT count(*) FROM sqlite_master WHERE type='table' AND name='{table_class.get_table_name()}';"
+        sql = "SELECT count(*) FROM sqlite_master WHERE type='table' AND name=?;"
 
         with DatabaseConnection(self, con_type=ConType.query):
-            self.cur.execute(sql)
+            self.cur.execute(sql, (table_class.get_table_name(),))
 
             return bool(self.cur.fetchone()[0])
 
-    def fetchone(self, sql: str) -> Tuple:
+    def fetchone(self, sql: str, params: Params=None) -> Tuple:
+
+        return self.__fetch__(sql, params, 'one')
+
+    def fetchall(self, sql: str, params: Params=None) -> List[Tuple]:
+
+        return list(self.__fetch__(sql, params, 'all'))
+
+    def __fetch__(self, sql: str, params: Params, mode: str) -> Any:
+        """Executing a query, or returning its rows from the query cache"""
+
+        query_cache = self.query_cache
+        key = None
+
+        if query_cache is not None and QueryCache.is_cacheable(sql):
+            key = QueryCache.key(sql, params, mode)
+
+        if key is not None:
+            if self.track_changes or self.__is_open__:
+                self.__sync_query_cache__()
+
+            found, rows = query_cache.get(key)
+
+            if found:
+                return rows
+
+            generation = query_cache.generation
+
+        with DatabaseConnection(self, con_type=ConType.query):
+            self.cur.execute(sql, params or ())
+
+            rows = self.cur.fetchone() if mode == 'one' else tuple(self.cur.fetchall())
+
+        if key is not None:
+            query_cache.put(key, sql, rows, generation)
+
+        return rows
+
+    def enable_change_tracking(self, table_class: Table.__subclasses__) -> None:
+        """Creating the triggers counting the changes of a table in the ChangeLog table"""
+
+        table_name = table_class.get_table_name()
+
+        with DatabaseConnection(self, con_type=ConType.mutation):
+            self.cur.execute(ChangeLog.get_statements().create_table)
+            self.cur.execute(ChangeLog.register, (table_name,))
+
+            for trigger in ChangeLog.triggers(table_name):
+                self.cur.execute(trigger)
+
+        if ChangeLog.get_table_name() not in self.trigger_table_names:
+            self.trigger_table_names.append(ChangeLog.get_table_name())
+
+    def data_version(self) -> int:
+        """Returns PRAGMA data_version of the connection. It changes when another connection commits a write.
+        Only meaningful on a persistent connection (see open())"""
 
         with DatabaseConnection(self, con_type=ConType.query):
-            self.cur.execute(sql)
+            self.cur.execute('PRAGMA data_version')
 
-            return self.cur.fetchone()
+            return self.cur.fetchone()[0]
 
-    def fetchall(self, sql: str) -> List[Tuple]:
+    def table_versions(self) -> Dict[str, int]:
+        """Returns the change counters of the tracked tables, by table name. Bypasses the query cache"""
 
         with DatabaseConnection(self, con_type=ConType.query):
-            self.cur.execute(sql)
+            try:
+                self.cur.execute(ChangeLog.select_versions)
+            except sqlite.OperationalError:
+                # no table is tracked yet
+                return dict()
+
+            return dict(self.cur.fetchall())
+
+    def table_version(self, table_class: Table.__subclasses__) -> Optional[int]:
+        """Returns the change counter of a tracked table. Compare it to a previous value to find out if the table changed"""
+
+        return self.table_versions().get(table_class.get_table_name())
+
+    def __sync_query_cache__(self) -> None:
+        """Invalidating the cached results of tables changed by other connections, possibly in other processes.
+        On a persistent connection PRAGMA data_version tells if anything changed at all, which is cheaper than
+        reading the ChangeLog. Without change tracking, the whole cache is dropped when anything changed.
+        Checking costs a query (and a connection, unless the database is open), so it is done at most
+        every sync_interval seconds of the query cache, per thread"""
+
+        now = time.monotonic()
+        last_sync = getattr(self.__local__, 'last_sync', None)
+
+        if last_sync is not None and now - last_sync < self.query_cache.sync_interval:
+            return
+
+        self.__local__.last_sync = now
 
-            return self.cur.fetchall()
+        if self.__is_open__:
+            with DatabaseConnection(self, con_type=ConType.query):
+                self.cur.execute('PRAGMA data_version')
+                data_version = (self.con, self.cur.fetchone()[0])
+
+            last_data_version = getattr(self.__local__, 'data_version', None)
+
+            if last_data_version is not None and last_data_version[0] is data_version[0] and last_data_version[1] == data_version[1]:
+                return
+
+            self.__local__.data_version = data_version
+
+        if not self.track_changes:
+            self.query_cache.clear()
+            return
+
+        table_versions = self.table_versions()
+
+        with self.__lock__:
+            changed_table_names = [name for name, version in table_versions.items()
+                                   if self.__table_versions__.get(name) != version]
+
+            self.__table_versions__ = table_versions
+
+        if changed_table_names:
+            self.query_cache.invalidate(*changed_table_names)
+
+    def __invalidate__(self, table_name: Optional[str]) -> None:
+        """Dropping the cached results of a table written to. All cached results if the table is unknown"""
+
+        if self.query_cache is None:
+            return
+
+        if table_name is None:
+            self.query_cache.clear()
+        else:
+            self.query_cache.invalidate(table_name, *self.trigger_table_names)
+
+        if self.is_batching:
+            # other threads may cache rows from before the write until the batch commits
+            self.__local__.batch_table_names = getattr(self.__local__, 'batch_table_names', set())
+            self.__local__.batch_table_names.add(table_name)
 
-    def __mutate__(self, sql: str, value_list: List[Any]=None, return_id=False) -> int:
+    def __end_batch__(self) -> None:
+        """Called when a batch committed. Invalidates the tables written during the batch once more"""
+
+        table_names = getattr(self.__local__, 'batch_table_names', None)
+
+        if table_names:
+            self.__local__.batch_table_names = set()
+
+            for table_name in table_names:
+                self.__invalidate__(table_name)
+
+    @staticmethod
+    def __combine_params__(values: List[Any], params: Params, values_first: bool=True) -> Tuple[List[str], Params]:
+        """Returns placeholders for internally bound values, and the values combined with the params of a condition.
+        sqlite can not mix named and positional parameters, so named placeholders are used for named params"""
+
+        if isinstance(params, Mapping):
+            names = [f'__value_{index}' for index in range(len(values))]
+            combined_params = dict(params)
+            combined_params.update(zip(names, values))
+
+            return [f':{name}' for name in names], combined_params
+
+        if values_first:
+            return ['?'] * len(values), list(values) + list(params or ())
+
+        return ['?'] * len(values), list(params or ()) + list(values)
+
+    def __mutate__(self, sql: str, value_list: Params=None, return_id=False) -> int:
+
+        row_id = -1
 
         with DatabaseConnection(self, con_type=ConType.mutation):
 
@@ -101,91 +416,474 @@ class MrDatabase:
 
             if return_id:
                 self.cur.execute('SELECT last_insert_rowid()')
-                return self.cur.fetchone()[0]
+                row_id = self.cur.fetchone()[0]
+
+        # after the commit, so no other thread can cache the rows from before the write
+        self.__invalidate__(QueryCache.mutated_table_name(sql))
 
-        return -1
+        return row_id
 
-    def delete_record(self, record_object: Table.__subclasses__, condition: str=None) -> str:
-        """Constructing the sql for deleting a record"""
+    @staticmethod
+    def __has_default_condition__(record_object: Table.__subclasses__) -> bool:
+        """ True if the record uses the default update condition, which the compiled statements can replace """
+
+        statements = record_object.get_statements()
+
+        return statements.pk_col_names == ('id',) and \
+            type(record_object).default_update_condition is Table.default_update_condition
+
+    def delete_record(self, record_object: Table.__subclasses__, condition: str=None, params: Params=None) -> str:
+        """Constructing the sql for deleting a record. Values in the condition are bound from params"""
+
+        if condition is None and self.__has_default_condition__(record_object):
+            sql = record_object.get_statements().delete_by_pk
+
+            logging.info('DELETE RECORD: %s %s', sql, record_object.id)
+
+            self.__mutate__(sql, [record_object.id])
+
+            return sql
 
         if condition is None:
             condition = record_object.default_update_condition()
 
         sql = f'DELETE FROM {record_object.get_table_name()} WHERE {condition};'
 
-        logging.info(f'DELETE RECORD: {sql}')
+        logging.info(f'DELETE RECORD: {sql} {params}')
 
-        self.__mutate__(sql)
+        self.__mutate__(sql, params)
 
         return sql
 
-    def update_record(self, record_object: Table.__subclasses__, condition: str=None) -> str:
-        """Constructing the sql for updating a record"""
+    def update_record(self, record_object: Table.__subclasses__, condition: str=None, params: Params=None) -> str:
+        """Constructing the sql for updating a record. Values in the condition are bound from params"""
+
+        statements = record_object.get_statements()
+
+        if condition is None and self.__has_default_condition__(record_object):
+            # only the columns changed since the record was loaded or last saved are written
+            dirty_col_names = tuple(name for name in record_object.get_dirty_col_names() if name != 'id')
+
+            if not dirty_col_names:
+                logging.info('UPDATE RECORD: skipped, %s has no changes', statements.table_name)
+                return ''
+
+            sql = statements.update_by_pk_for(dirty_col_names)
+
+            with self.__blob_batch__(record_object):
+                self.__ingest_blobs__([record_object], dirty_col_names)
+
+                value_list = record_object.get_sql_values(dirty_col_names)
+                value_list.append(record_object.id)
+
+                logging.info('UPDATE RECORD: %s %s', sql, value_list)
+
+                self.__mutate__(sql, value_list)
+
+            record_object.mark_clean()
+
+            return sql
 
         if condition is None:
             condition = record_object.default_update_condition()
 
-        table_name = record_object.get_table_name()
-        attributes = record_object.get_col_names()
-        values = list(record_object.get_values())
-        update = ", ".join(f'{attrib}=?' for attrib in attributes)
+        if params is None:
+            # legacy 'column = integer' condition without params
+            condition_params = condition.split('=')
+            condition = "%s=?" % condition_params[0].strip()
+            params = [int(condition_params[1].strip())]
 
-        condition_params = condition.split('=')
-        condition_string = "%s=?" % condition_params[0].strip()
-        value_list = values + [int(condition_params[1].strip())]
+        with self.__blob_batch__(record_object):
+            self.__ingest_blobs__([record_object], statements.col_names)
 
-        sql = f'UPDATE {table_name} SET {update} WHERE {condition_string};'
+            values = record_object.get_sql_values(statements.col_names)
+            placeholders, value_list = self.__combine_params__(values, params)
+            update = ", ".join(f'{attrib}={placeholder}' for attrib, placeholder in zip(statements.col_names, placeholders))
 
-        logging.info(f'UPDATE RECORD: {sql} {value_list}')
+            sql = f'UPDATE {statements.table_name} SET {update} WHERE {condition};'
 
-        self.__mutate__(sql, value_list)
+            logging.info(f'UPDATE RECORD: {sql} {value_list}')
+
+            self.__mutate__(sql, value_list)
+
+        record_object.mark_clean()
 
         return sql
 
     def insert_record(self, record_object: Table.__subclasses__) -> str:
-        """Constructing the sql for inserting a record"""
+        """Inserting a record using the compiled insert statement of its table class"""
 
         # in case of integer primary key attributes, the attribute is auto incrementing.
-        # in this case we need to omit the a attribute from the sql statement.
-        int_pks = record_object.__class__.has_int_pk()
+        # in this case the compiled statement omits the attribute.
+        statements = record_object.get_statements()
 
-        pairs = list(zip(record_object.get_col_names(), record_object.get_values()))
-        table_name = record_object.get_table_name()
+        sql = statements.insert
 
-        attributes = [p[0] for p in pairs if p[0] not in int_pks]
-        values = [p[1] for p in pairs if p[0] not in int_pks]
+        with self.__blob_batch__(record_object):
+            self.__ingest_blobs__([record_object], statements.insert_col_names)
 
-        values_string = ", ".join(['?'] * len(attributes))
-        attributes_string = ", ".join((str(attribute) for attribute in attributes))
+            values = record_object.get_sql_values(statements.insert_col_names)
 
-        sql = f'INSERT INTO {table_name}({attributes_string}) VALUES ({values_string});'
+            logging.info('INSERT RECORD: %s %s', sql, values)
 
-        logging.info(f'INSERT RECORD: {sql} {values}')
+            record_object.id = self.__mutate__(sql, values, return_id=len(statements.int_pk_col_names) > 0)
 
-        record_object.id = self.__mutate__(sql, list(values), return_id=len(int_pks) > 0)
+        record_object.mark_clean()
 
         return sql
 
-    def select_record(self, table_class: Table.__subclasses__, condition: str) -> Table.__subclasses__:
-        """Constructing the sql for selecting a record"""
+    def __blob_batch__(self, record_object: Table.__subclasses__) -> ContextManager:
+        """Writes to tables with dedup columns are batched, so the blob values and the rows are written in one transaction"""
+
+        if record_object.get_schema().dedup_col_names:
+            return DatabaseConnection(self, con_type=ConType.batch)
+
+        # an empty ExitStack does nothing, like contextlib.nullcontext (Python 3.7)
+        return contextlib.ExitStack()
+
+    def __ingest_blobs__(self, record_objects: List[Table.__subclasses__], col_names: Tuple[str]) -> None:
+        """Storing the values of the dedup columns of records of one table class in the BlobStore, once per value.
+        Must be called inside a batch"""
+
+        if not record_objects:
+            return
+
+        schema = record_objects[0].get_schema()
+        dedup_col_names = [name for name in schema.dedup_col_names if name in col_names]
+
+        if not dedup_col_names:
+            return
+
+        blob_rows = dict()
+
+        for col_name in dedup_col_names:
+            column = schema.columns[schema.col_indices[col_name]]
+
+            for record_object in record_objects:
+                # values not loaded, or loaded and not accessed, are in the store already
+                if record_object.__peek_value__(col_name) is None:
+                    continue
+
+                content_hash = record_object.__blob_hash__(col_name)
+
+                if content_hash not in blob_rows:
+                    stored_value = column.to_sql(getattr(record_object, col_name))
+                    blob_rows[content_hash] = (content_hash, len(stored_value), stored_value)
+
+        logging.info('INGEST BLOBS: %s (%s blobs)', BlobStore.ingest, len(blob_rows))
+
+        self.__invalidate__(BlobStore.get_table_name())
+
+        self.cur.executemany(BlobStore.ingest, blob_rows.values())
+
+    def store_blobs(self, blobs: Iterable[bytes]) -> List[str]:
+        """Bulk ingest of values into the BlobStore, in a single transaction. Returns their content hashes.
+        Values not referenced by a dedup column before the next collect_blobs() are removed again"""
+
+        content_hashes = list()
+        blob_rows = dict()
+
+        for blob in blobs:
+            content_hash = Column.content_hash(blob)
+            content_hashes.append(content_hash)
+            blob_rows[content_hash] = (content_hash, len(blob), blob)
+
+        self.__invalidate__(BlobStore.get_table_name())
+
+        with DatabaseConnection(self, con_type=ConType.batch):
+            self.cur.execute(BlobStore.get_statements().create_table)
+            self.cur.executemany(BlobStore.ingest, blob_rows.values())
+
+        return content_hashes
+
+    def select_blob(self, content_hash: str) -> Optional[bytes]:
+        """Returns a value from the BlobStore, as stored"""
+
+        row = self.fetchone(BlobStore.select_data, (content_hash,))
+
+        return row[0] if row else None
+
+    def collect_blobs(self) -> int:
+        """Removes the values no longer referenced by any dedup column from the BlobStore. Returns how many"""
+
+        if not self.table_exists(BlobStore):
+            return 0
+
+        with DatabaseConnection(self, con_type=ConType.mutation):
+            logging.info('COLLECT BLOBS: %s', BlobStore.collect)
+
+            self.__invalidate__(BlobStore.get_table_name())
+
+            self.cur.execute(BlobStore.collect)
+
+            return self.cur.rowcount
+
+    @staticmethod
+    def __group_by_table_class__(record_objects: Iterable[Table.__subclasses__]) -> Dict[Table.__subclasses__, List[Table.__subclasses__]]:
+
+        grouped_records: Dict[Table.__subclasses__, List[Table.__subclasses__]] = dict()
+
+        for record_object in record_objects:
+            grouped_records.setdefault(record_object.__class__, list()).append(record_object)
+
+        return grouped_records
+
+    def __insert_group__(self, table_class: Table.__subclasses__, table_records: List[Table.__subclasses__]) -> str:
+        """Inserting records of one table class with a single executemany. Must be called inside a batch"""
+
+        statements = table_class.get_statements()
+        sql = statements.insert
+        attributes = statements.insert_col_names
+
+        logging.info('INSERT RECORDS: %s (%s records)', sql, len(table_records))
+
+        self.__invalidate__(statements.table_name)
+
+        self.__ingest_blobs__(table_records, attributes)
+        self.cur.executemany(sql, (record_object.get_sql_values(attributes) for record_object in table_records))
+
+        if statements.int_pk_col_names:
+            # the write lock is held for the whole transaction, so the auto incremented ids are contiguous
+            self.cur.execute('SELECT last_insert_rowid()')
+            first_id = self.cur.fetchone()[0] - len(table_records) + 1
+            id_attribute = statements.int_pk_col_names[0]
+
+            for offset, record_object in enumerate(table_records):
+                setattr(record_object, id_attribute, first_id + offset)
+
+        for record_object in table_records:
+            record_object.mark_clean()
+
+        return sql
+
+    @contextlib.contextmanager
+    def __bulk_transaction__(self, record_objects: List[Table.__subclasses__]) -> Generator[None, None, None]:
+        """A batch for writing many records. If it fails, it is rolled back as a whole,
+        and the records get back their integer primary keys and changed columns"""
+
+        snapshot = [(record_object,
+                     tuple((name, getattr(record_object, name)) for name in record_object.get_schema().int_pk_col_names),
+                     record_object.get_dirty_col_names())
+                    for record_object in record_objects]
+
+        try:
+            with DatabaseConnection(self, con_type=ConType.batch):
+                yield
+        except BaseException:
+            for record_object, pk_values, dirty_col_names in snapshot:
+                for name, value in pk_values:
+                    object.__setattr__(record_object, name, value)
+
+                object.__setattr__(record_object, '__dirty__', set(dirty_col_names) or None)
+
+            raise
+
+    def insert_records(self, record_objects: Iterable[Table.__subclasses__]) -> List[str]:
+        """Inserting records with one executemany per table class, all in a single transaction"""
+
+        record_objects = list(record_objects)
+
+        with self.__bulk_transaction__(record_objects):
+
+            return [self.__insert_group__(table_class, table_records)
+                    for table_class, table_records in self.__group_by_table_class__(record_objects).items()]
+
+    def update_records(self, record_objects: Iterable[Table.__subclasses__]) -> List[str]:
+        """Updating the changed columns of records by primary key, all in a single transaction.
+        One executemany per table class and set of changed columns. Records without changes are skipped"""
+
+        sql_statements = list()
+        record_objects = list(record_objects)
+
+        with self.__bulk_transaction__(record_objects):
+
+            for table_class, table_records in self.__group_by_table_class__(record_objects).items():
+
+                statements = table_class.get_statements()
+
+                if not statements.pk_col_names:
+                    raise ValueError(f'{statements.table_name} has no primary key')
+
+                records_by_dirty_cols: Dict[Tuple[str], List[Table.__subclasses__]] = dict()
+
+                for record_object in table_records:
+                    dirty_col_names = tuple(name for name in record_object.get_dirty_col_names() if name not in statements.pk_col_names)
+
+                    if dirty_col_names:
+                        records_by_dirty_cols.setdefault(dirty_col_names, list()).append(record_object)
+
+                for dirty_col_names, dirty_records in records_by_dirty_cols.items():
+                    sql = statements.update_by_pk_for(dirty_col_names)
+                    attributes = dirty_col_names + statements.pk_col_names
+
+                    logging.info('UPDATE RECORDS: %s (%s records)', sql, len(dirty_records))
+
+                    self.__invalidate__(statements.table_name)
+
+                    self.__ingest_blobs__(dirty_records, dirty_col_names)
+                    self.cur.executemany(sql, (record_object.get_sql_values(attributes) for record_object in dirty_records))
+
+                    for record_object in dirty_records:
+                        record_object.mark_clean()
+
+                    sql_statements.append(sql)
+
+        return sql_statements
+
+    def upsert_record(self, record_object: Table.__subclasses__, conflict_column: str=None) -> str:
+        """Inserting a record, or updating the existing record on a primary key or unique column conflict"""
+
+        return self.upsert_records([record_object], conflict_column=conflict_column)[-1]
+
+    def upsert_records(self, record_objects: Iterable[Table.__subclasses__], conflict_column: str=None) -> List[str]:
+        """Inserting records, or updating the existing records on a primary key or unique column conflict.
+        One executemany per table class, all in a single transaction"""
+
+        sql_statements = list()
+        record_objects = list(record_objects)
+
+        with self.__bulk_transaction__(record_objects):
+
+            for table_class, table_records in self.__group_by_table_class__(record_objects).items():
+
+                statements = table_class.get_statements()
+                int_pks = statements.int_pk_col_names
+                conflict = conflict_column or (statements.pk_col_names[0] if statements.pk_col_names else None)
+                schema = table_class.get_schema()
+                column = schema.columns[schema.col_indices[conflict]] if conflict in schema.col_indices else None
+
+                if column is None or not (column.pk or column.unique):
+                    raise ValueError(f'{statements.table_name}.{conflict} is neither a primary key nor unique')
+
+                if conflict in int_pks:
+                    # records without an id can not conflict. They are inserted, and get their ids back-filled
+                    new_records = [record_object for record_object in table_records if getattr(record_object, conflict) is None]
+                    table_records = [record_object for record_object in table_records if getattr(record_object, conflict) is not None]
+
+                    if new_records:
+                        sql_statements.append(self.__insert_group__(table_class, new_records))
+
+                    if not table_records:
+                        continue
+
+                sql = statements.upsert(conflict)
+                attributes = statements.col_names
 
-        sql = f'SELECT * FROM {table_class.get_table_name()} WHERE {condition};'
+                logging.info('UPSERT RECORDS: %s (%s records)', sql, len(table_records))
 
-        record = self.fetchone(sql)
+                self.__invalidate__(statements.table_name)
 
-        logging.info(f'GET RECORD: {sql}')
+                self.__ingest_blobs__(table_records, attributes)
+                self.cur.executemany(sql, (record_object.get_sql_values(attributes) for record_object in table_records))
+
+                if int_pks and conflict not in int_pks:
+                    # a conflicting row keeps its id, whichever id the record came with
+                    self.__fill_ids_by_column__(table_class, int_pks[0], conflict, table_records)
+
+                for record_object in table_records:
+                    record_object.mark_clean()
+
+                sql_statements.append(sql)
+
+        return sql_statements
+
+    def __fill_ids_by_column__(self, table_class: Table.__subclasses__, id_column: str, key_column: str, table_records: List[Table.__subclasses__]) -> None:
+        """Back-filling ids of records, looked up by a unique column. Must be called inside a batch"""
+
+        records_by_key = {getattr(record_object, key_column): record_object for record_object in table_records}
+        keys = list(records_by_key.keys())
+
+        for chunk_start in range(0, len(keys), SQLITE_MAX_VARIABLES):
+            chunk = keys[chunk_start:chunk_start + SQLITE_MAX_VARIABLES]
+
+            sql = f'SELECT {key_column}, {id_column} FROM {table_class.get_table_name()} ' \
+                  f'WHERE {key_column} IN ({", ".join(["?"] * len(chunk))});'
+
+            self.cur.execute(sql, chunk)
+
+            for key, record_id in self.cur.fetchall():
+                setattr(records_by_key[key], id_column, record_id)
+
+    @staticmethod
+    def __projection__(table_class: Table.__subclasses__, columns: Iterable[str]=None) -> Tuple[Optional[Tuple[str]], str]:
+        """Returns the selected column names (None for all) and the select statement without a WHERE clause.
+        Without explicit columns, deferred columns are left out. Primary keys are always selected"""
+
+        schema = table_class.get_schema()
+        statements = table_class.get_statements()
+
+        if columns is None:
+            if schema.deferred_col_names:
+                return schema.eager_col_names, statements.select_all
+
+            return None, statements.select_all
+
+        columns = set(columns)
+        unknown_columns = columns.difference(schema.col_names)
+
+        if unknown_columns:
+            raise ValueError(f'{schema.table_name} has no columns named {", ".join(sorted(unknown_columns))}')
+
+        col_names = tuple(name for name in schema.col_names if name in columns or name in schema.pk_col_names)
+
+        return col_names, statements.select_columns(col_names)
+
+    def __create_record__(self, table_class: Table.__subclasses__, sql_row: Tuple, col_names: Tuple[str]=None) -> Table.__subclasses__:
+
+        return self.__create_records__(table_class, (sql_row,), col_names)[0]
+
+    def __create_records__(self, table_class: Table.__subclasses__, sql_rows: Iterable[Tuple], col_names: Tuple[str]=None) -> List[Table.__subclasses__]:
+        """Building the records of sql rows with the compiled record factory of the table class"""
+
+        create = table_class.get_record_factory(col_names)
+        records = [create(sql_row) for sql_row in sql_rows]
+
+        # columns left out are loaded from this database when first accessed,
+        # and the values of dedup columns from the BlobStore of this database
+        if col_names is not None or table_class.__schema__.dedup_col_names:
+            for record in records:
+                object.__setattr__(record, '__database__', self)
+
+        return records
+
+    def select_record(self, table_class: Table.__subclasses__, condition: str, params: Params=None, columns: Iterable[str]=None) -> Table.__subclasses__:
+        """Constructing the sql for selecting a record. Values in the condition are bound from params.
+        Only the given columns are selected, if any. The others are loaded when first accessed"""
+
+        col_names, select = self.__projection__(table_class, columns)
+        sql = f'{select} WHERE {condition};'
+
+        record = self.fetchone(sql, params)
+
+        logging.info(f'GET RECORD: {sql} {params}')
 
         if record:
-            data_type_instance = table_class()
-            data_type_instance.from_sql_record(record)
+            return self.__create_record__(table_class, record, col_names)
+
+    def select_record_by_pk(self, table_class: Table.__subclasses__, *pk_values, columns: Iterable[str]=None) -> Table.__subclasses__:
+        """Selecting a record by primary key, using the compiled statement of the table class"""
+
+        statements = table_class.get_statements()
+
+        if statements.select_by_pk is None:
+            raise ValueError(f'{table_class.get_table_name()} has no primary key')
 
-            return data_type_instance
+        col_names, select = self.__projection__(table_class, columns)
+        sql = statements.select_by_pk if columns is None else f'{select} WHERE {statements.pk_condition};'
 
-    def select_records(self, table_class: Table.__subclasses__, condition: str=None, order_by: List[str]=None, order_asc: bool=True, limit: int=0) -> Records:
+        record = self.fetchone(sql, pk_values)
+
+        logging.info('GET RECORD: %s %s', sql, pk_values)
+
+        if record:
+            return self.__create_record__(table_class, record, col_names)
+
+    @staticmethod
+    def __select_records_sql__(table_class: Table.__subclasses__, condition: str=None, order_by: List[str]=None, order_asc: bool=True, limit: int=0, select: str=None) -> str:
 
         sql_comps = list()
 
-        sql_comps.append(f'SELECT * FROM {table_class.get_table_name()}')
+        sql_comps.append(select or table_class.get_statements().select_all)
 
         if condition is not None:
             sql_comps.append(f'WHERE {condition}')
@@ -207,22 +905,486 @@ class MrDatabase:
             sql_comps.append(f'LIMIT {limit}')
 
         sql_comps.append(';')
-        sql = ' '.join(sql_comps)
 
-        logging.info(f'GET RECORDS: {sql}')
+        return ' '.join(sql_comps)
 
-        records = self.fetchall(sql)
+    def select_records(self, table_class: Table.__subclasses__, condition: str=None, order_by: List[str]=None, order_asc: bool=True, limit: int=0, params: Params=None, columns: Iterable[str]=None, prefetch: List[str]=None, lazy: bool=False) -> Records:
+        """Selecting records. The records of the join tables named in prefetch are attached with one query per join table.
+        If lazy, the rows are returned as RowRecords, which only build the records accessed"""
 
-        def create_data_type(data_type, record):
-            data_type_instance = data_type()
-            data_type_instance.from_sql_record(record)
+        col_names, select = self.__projection__(table_class, columns)
+        sql = self.__select_records_sql__(table_class, condition, order_by, order_asc, limit, select)
 
-            return data_type_instance
+        logging.info(f'GET RECORDS: {sql} {params}')
 
-        records: Records = Records([create_data_type(table_class, record) for record in records])
+        records = self.fetchall(sql, params)
+
+        if lazy:
+            records: Records = RowRecords(records, table_class, self, col_names)
+        else:
+            records: Records = Records(self.__create_records__(table_class, records, col_names), table_class)
+
+        if prefetch:
+            records.fetch_join_tables(self, prefetch)
 
         return records
 
+    def fetch_join_tables(self, record_objects: Iterable[Table.__subclasses__], join_table_names: Iterable[str]=None) -> None:
+        """Attaching the join table records to records of one table class. The distinct foreign key values of all records
+        are selected with one 'IN' query per join table (chunked below the sqlite variable limit), instead of one query per record"""
+
+        record_objects = list(record_objects)
+
+        if not record_objects:
+            return
+
+        definitions = record_objects[0].__join_table_definitions__
+
+        if join_table_names is None:
+            join_table_names = definitions.keys()
+
+        for join_table_name in join_table_names:
+            fk_table_info = definitions.get(join_table_name)
+
+            if fk_table_info is None:
+                raise ValueError(f'{record_objects[0].get_table_name()} has no join table named {join_table_name}')
+
+            join_table_class = fk_table_info['table_class']
+            fk = fk_table_info['fk']
+            attribute = fk_table_info['property']
+
+            fk_values = list({getattr(record_object, attribute) for record_object in record_objects} - {None})
+            col_names, select = self.__projection__(join_table_class)
+            join_records = dict()
+
+            with DatabaseConnection(self, con_type=ConType.query):
+
+                for chunk_start in range(0, len(fk_values), SQLITE_MAX_VARIABLES):
+                    chunk = fk_values[chunk_start:chunk_start + SQLITE_MAX_VARIABLES]
+                    sql = f'{select} WHERE {fk} IN ({", ".join(["?"] * len(chunk))});'
+
+                    logging.info('FETCH JOIN TABLES: %s (%s records)', sql, len(chunk))
+
+                    self.cur.execute(sql, chunk)
+
+                    for join_record in self.__create_records__(join_table_class, self.cur.fetchall(), col_names):
+                        join_records[getattr(join_record, fk)] = join_record
+
+            for record_object in record_objects:
+                record_object.add_table_to_join_table_dict(join_table_name, join_records.get(getattr(record_object, attribute)))
+
+    @staticmethod
+    def __aggregate_expression__(table_class: Table.__subclasses__, function: str, col_name: str) -> str:
+        """Returns the sql of an aggregate function over a column, validated against the table schema"""
+
+        function = function.lower()
+
+        if function not in AGGREGATE_FUNCTIONS:
+            raise ValueError(f'Unknown aggregate function: {function}. Choose from {", ".join(AGGREGATE_FUNCTIONS)}')
+
+        if col_name == '*' and function == 'count':
+            return 'count(*)'
+
+        if col_name not in table_class.get_schema().col_indices:
+            raise ValueError(f'{table_class.get_table_name()} has no column named {col_name}')
+
+        return f'{function}({col_name})'
+
+    def count(self, table_class: Table.__subclasses__, condition: str=None, params: Params=None) -> int:
+        """Counting the records matching a condition, without selecting them"""
+
+        sql = self.__select_records_sql__(table_class, condition, select=f'SELECT count(*) FROM {table_class.get_table_name()}')
+
+        logging.info('COUNT: %s %s', sql, params)
+
+        return self.fetchone(sql, params)[0]
+
+    def exists(self, table_class: Table.__subclasses__, condition: str=None, params: Params=None) -> bool:
+        """True if any record matches a condition. sqlite stops at the first match"""
+
+        where = f' WHERE {condition}' if condition is not None else ''
+        sql = f'SELECT EXISTS (SELECT 1 FROM {table_class.get_table_name()}{where});'
+
+        logging.info('EXISTS: %s %s', sql, params)
+
+        return bool(self.fetchone(sql, params)[0])
+
+    def aggregate(self, table_class: Table.__subclasses__, aggregates: Mapping[str, Tuple[str, str]], condition: str=None, params: Params=None, group_by: List[str]=None) -> Union[Dict[str, Any], List[Dict[str, Any]]]:
+        """Computing aggregates in sqlite, e.g. {'newest': ('max', 'id'), 'cities': ('count', '*')}.
+        Returns a dict of the aggregates by alias. With group_by, a list of dicts holding the group_by columns
+        and the aggregates of each group, ordered by the group_by columns"""
+
+        group_by = list(group_by or [])
+
+        for alias in aggregates:
+            if not alias.isidentifier():
+                raise ValueError(f'Invalid alias: {alias}')
+
+        expressions = [f'{self.__aggregate_expression__(table_class, function, col_name)} AS {alias}'
+                       for alias, (function, col_name) in aggregates.items()]
+
+        unknown_columns = set(group_by).difference(table_class.get_schema().col_names)
+
+        if unknown_columns:
+            raise ValueError(f'{table_class.get_table_name()} has no columns named {", ".join(sorted(unknown_columns))}')
+
+        sql_comps = [f'SELECT {", ".join(group_by + expressions)} FROM {table_class.get_table_name()}']
+
+        if condition is not None:
+            sql_comps.append(f'WHERE {condition}')
+
+        if group_by:
+            sql_comps.append(f'GROUP BY {", ".join(group_by)} ORDER BY {", ".join(group_by)}')
+
+        sql = ' '.join(sql_comps) + ';'
+
+        logging.info('AGGREGATE: %s %s', sql, params)
+
+        names = group_by + list(aggregates)
+        rows = self.fetchall(sql, params)
+
+        if not group_by:
+            return dict(zip(names, rows[0]))
+
+        return [dict(zip(names, row)) for row in rows]
+
+    def select_page(self, table_class: Table.__subclasses__, after: Union[str, Tuple, None]=None, order_by: List[str]=None, order_asc: bool=True, page_size: int=100, condition: str=None, params: Params=None, columns: Iterable[str]=None) -> Tuple[Records, Optional[str]]:
+        """Selecting a page of records using keyset (seek) pagination. Returns the page and a continuation token
+        to pass as 'after' for the next page, or None after the last page. Every page costs the same,
+        no matter how deep you go. The primary key is added to order_by as a tie breaker, and order_asc
+        applies to all the order_by columns. NULL values are paged in sqlite's order, first ascending and last descending"""
+
+        key_columns = list(order_by or [])
+        key_columns += [pk for pk in table_class.get_pk_col_names() if pk not in key_columns]
+
+        if not key_columns:
+            raise ValueError(f'{table_class.get_table_name()} has no primary key. Provide order_by columns')
+
+        order = 'ASC' if order_asc else 'DESC'
+        keys = ', '.join(key_columns)
+
+        conditions = list()
+
+        if condition is not None:
+            conditions.append(f'({condition})')
+
+        if after is not None:
+            after_values = self.__decode_page_token__(after) if isinstance(after, str) else list(after)
+
+            if len(after_values) != len(key_columns):
+                raise ValueError(f'Expected {len(key_columns)} key values after ({keys}), got {len(after_values)}')
+
+            schema = table_class.get_schema()
+            key_column_objects = [schema.columns[schema.col_indices[key]] if key in schema.col_indices else None for key in key_columns]
+            nullable = [column is None or not (column.pk or column.not_null) for column in key_column_objects]
+
+            seek_condition, seek_values = self.__seek_condition__(key_columns, after_values, nullable, order_asc)
+            placeholders, params = self.__combine_params__(seek_values, params, values_first=False)
+            conditions.append(seek_condition.format(*placeholders))
+
+        col_names, select = self.__projection__(table_class, None if columns is None else list(columns) + key_columns)
+        sql_comps = [select]
+
+        if conditions:
+            sql_comps.append(f'WHERE {" AND ".join(conditions)}')
+
+        sql_comps.append(f'ORDER BY {", ".join(f"{key} {order}" for key in key_columns)}')
+        sql_comps.append(f'LIMIT {int(page_size)};')
+
+        sql = ' '.join(sql_comps)
+
+        logging.info('GET PAGE: %s %s', sql, params)
+
+        rows = self.fetchall(sql, params)
+
+        records: Records = Records(self.__create_records__(table_class, rows, col_names), table_class)
+
+        token = None
+
+        if len(rows) == page_size:
+            last_record = records.last()
+            token = self.__encode_page_token__([getattr(last_record, key) for key in key_columns])
+
+        return records, token
+
+    @staticmethod
+    def __seek_condition__(key_columns: List[str], after_values: List[Any], nullable: List[bool], order_asc: bool) -> Tuple[str, List[Any]]:
+        """Returns the condition selecting the rows ordered after after_values, with a {} for each of the values returned.
+        sqlite orders NULL first ascending and last descending, but a row value comparison with a NULL is NULL.
+        If a key may be NULL, the comparison is spelled out key by key"""
+
+        operator = '>' if order_asc else '<'
+
+        if not any(nullable) and None not in after_values:
+            return f'({", ".join(key_columns)}) {operator} ({", ".join("{}" for _ in key_columns)})', list(after_values)
+
+        terms = list()
+        values = list()
+
+        for index, (key, value) in enumerate(zip(key_columns, after_values)):
+            # rows equal on the keys before, and ordered after on this key
+            term = list()
+            term_values = list()
+
+            for prior_key, prior_value in zip(key_columns[:index], after_values[:index]):
+                if prior_value is None:
+                    term.append(f'{prior_key} IS NULL')
+                else:
+                    term.append(f'{prior_key} = {{}}')
+                    term_values.append(prior_value)
+
+            if value is None:
+                if not order_asc:
+                    # nothing is ordered after NULL descending
+                    continue
+
+                term.append(f'{key} IS NOT NULL')
+
+            else:
+                term.append(f'({key} {operator} {{}} OR {key} IS NULL)' if nullable[index] and not order_asc else f'{key} {operator} {{}}')
+                term_values.append(value)
+
+            terms.append(f'({" AND ".join(term)})')
+            values += term_values
+
+        return f'({" OR ".join(terms) or "0"})', values
+
+    @staticmethod
+    def __encode_page_token__(key_values: List[Any]) -> str:
+        return base64.urlsafe_b64encode(json.dumps(key_values).encode('utf-8')).decode('ascii')
+
+    @staticmethod
+    def __decode_page_token__(token: str) -> List[Any]:
+        return json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+
+    def iter_records(self, table_class: Table.__subclasses__, condition: str=None, order_by: List[str]=None, order_asc: bool=True, limit: int=0, chunk_size: int=1000, params: Params=None, columns: Iterable[str]=None) -> Generator[Table.__subclasses__, None, None]:
+        """Yielding records one by one. The cursor stays open and rows are fetched in chunks of chunk_size,
+        so memory use stays flat no matter how many rows the query returns.
+        With a rollback journal, the open cursor blocks writes from other connections while iterating.
+        Writing from the same thread works with an open (persistent) database or a WAL journal.
+        The generator uses a connection of its own (the long-lived one, if the database is open), so it is
+        independent of the batches and other generators it overlaps with"""
+
+        col_names, select = self.__projection__(table_class, columns)
+        sql = self.__select_records_sql__(table_class, condition, order_by, order_asc, limit, select)
+
+        logging.info(f'ITER RECORDS: {sql} {params}')
+
+        con = self.__connection__()
+        cur = con.cursor()
+
+        try:
+            cur.execute(sql, params or ())
+
+            while True:
+                rows = cur.fetchmany(chunk_size)
+
+                if not rows:
+                    break
+
+                yield from self.__create_records__(table_class, rows, col_names)
+
+        finally:
+            cur.close()
+            self.__release_connection__(con)
+
+    def select_columns(self, table_class: Table.__subclasses__, columns: Iterable[str]=None, condition: str=None, params: Params=None, order_by: List[str]=None, order_asc: bool=True, limit: int=0, chunk_size: int=10000) -> Dict[str, Any]:
+        """Selecting whole columns for analytics, without building records. Returns an array per column,
+        filled from cursor chunks of chunk_size rows: NumPy arrays if NumPy is installed, otherwise array.array
+        for integer columns and lists for the others. Integer columns holding NULL turn into float arrays with NaN.
+        Without columns, all columns but the deferred ones are selected"""
+
+        schema = table_class.get_schema()
+        col_names = schema.eager_col_names if columns is None else tuple(columns)
+
+        unknown_columns = set(col_names).difference(schema.col_names)
+
+        if unknown_columns:
+            raise ValueError(f'{schema.table_name} has no columns named {", ".join(sorted(unknown_columns))}')
+
+        encoded_columns = set(col_names).intersection(schema.encoded_col_names)
+
+        if encoded_columns:
+            raise ValueError(f'{", ".join(sorted(encoded_columns))} of {schema.table_name} are compressed or deduplicated '
+                             f'and can not be selected as arrays')
+
+        buffers = [ColumnBuffer(schema.columns[schema.col_indices[col_name]]) for col_name in col_names]
+
+        select = table_class.get_statements().select_columns(col_names)
+        sql = self.__select_records_sql__(table_class, condition, order_by, order_asc, limit, select)
+
+        logging.info('SELECT COLUMNS: %s %s', sql, params)
+
+        with DatabaseConnection(self, con_type=ConType.query):
+            cur = self.con.cursor()
+            cur.execute(sql, params or ())
+
+            try:
+                while True:
+                    rows = cur.fetchmany(chunk_size)
+
+                    if not rows:
+                        break
+
+                    for buffer, values in zip(buffers, zip(*rows)):
+                        buffer.extend(values)
+
+            finally:
+                cur.close()
+
+        return {col_name: buffer.to_array() for col_name, buffer in zip(col_names, buffers)}
+
+    def load_columns(self, record_objects: Iterable[Table.__subclasses__], col_names: Iterable[str]=None) -> None:
+        """Loading deferred or unselected columns for many records at once, with one query per table class
+        and chunk of primary keys. Without col_names, all columns not yet loaded are loaded"""
+
+        for table_class, table_records in self.__group_by_table_class__(record_objects).items():
+
+            schema = table_class.get_schema()
+
+            if len(schema.pk_col_names) != 1:
+                raise ValueError(f'Loading columns of {schema.table_name} requires a single primary key')
+
+            pk = schema.pk_col_names[0]
+
+            if col_names is None:
+                load_col_names = tuple(name for name in schema.col_names
+                                       if any(not record_object.is_loaded(name) for record_object in table_records))
+            else:
+                col_names = set(col_names)
+                load_col_names = tuple(name for name in schema.col_names if name in col_names and name != pk)
+
+            if not load_col_names:
+                continue
+
+            records_by_pk = dict()
+
+            for record_object in table_records:
+                records_by_pk.setdefault(getattr(record_object, pk), list()).append(record_object)
+
+            pk_values = list(records_by_pk.keys())
+            select = table_class.get_statements().select_columns((pk,) + load_col_names)
+
+            with DatabaseConnection(self, con_type=ConType.query):
+
+                for chunk_start in range(0, len(pk_values), SQLITE_MAX_VARIABLES):
+                    chunk = pk_values[chunk_start:chunk_start + SQLITE_MAX_VARIABLES]
+                    sql = f'{select} WHERE {pk} IN ({", ".join(["?"] * len(chunk))});'
+
+                    logging.info('LOAD COLUMNS: %s (%s records)', sql, len(chunk))
+
+                    self.cur.execute(sql, chunk)
+
+                    for row in self.cur.fetchall():
+                        for record_object in records_by_pk[row[0]]:
+                            record_object.__set_loaded_values__(load_col_names, row[1:])
+
+    def __rowid__(self, record_object: Table.__subclasses__) -> int:
+        """Returns the rowid of a record. Integer primary keys are aliases of the rowid"""
+
+        schema = record_object.get_schema()
+
+        if schema.int_pk_col_names:
+            return getattr(record_object, schema.int_pk_col_names[0])
+
+        statements = record_object.get_statements()
+        pk_values = [getattr(record_object, pk) for pk in schema.pk_col_names]
+
+        self.cur.execute(f'SELECT rowid FROM {schema.table_name} WHERE {statements.pk_condition};', pk_values)
+
+        return self.cur.fetchone()[0]
+
+    @staticmethod
+    def __check_streamable__(record_object: Table.__subclasses__, col_name: str) -> None:
+        """Raises a ValueError for columns which can not be streamed, before any sql runs"""
+
+        if not BLOB_STREAMING:
+            raise NotImplementedError('Blob streaming requires Python 3.11 or later (sqlite3.Connection.blobopen)')
+
+        if col_name in record_object.get_schema().encoded_col_names:
+            raise ValueError(f'{record_object.get_table_name()}.{col_name} is compressed or deduplicated and can not be streamed')
+
+    @contextlib.contextmanager
+    def open_blob(self, record_object: Table.__subclasses__, col_name: str, readonly: bool=True) -> Generator['sqlite.Blob', None, None]:
+        """Opens a blob column of a record as a file-like object (read, write, seek, tell),
+        without reading the blob into memory. Writing can not change the size of the blob"""
+
+        self.__check_streamable__(record_object, col_name)
+
+        con_type = ConType.query if readonly else ConType.mutation
+
+        try:
+            with DatabaseConnection(self, con_type=con_type):
+                blob = self.con.blobopen(record_object.get_table_name(), col_name, self.__rowid__(record_object), readonly=readonly)
+
+                try:
+                    yield blob
+                finally:
+                    blob.close()
+
+        finally:
+            if not readonly:
+                # after the commit, so no other thread can cache the rows from before the write
+                self.__invalidate__(record_object.get_table_name())
+
+    def write_blob(self, record_object: Table.__subclasses__, col_name: str, file_object, md5_col_name: str=None, chunk_size: int=BLOB_CHUNK_SIZE) -> str:
+        """Streams a file object into a blob column of an existing record, chunk by chunk, and returns its md5.
+        The column is preallocated with zeroblob, and the md5 is computed in the same pass.
+        The md5 is also written to md5_col_name, if given"""
+
+        statements = record_object.get_statements()
+
+        if not statements.pk_col_names:
+            raise ValueError(f'{statements.table_name} has no primary key')
+
+        self.__check_streamable__(record_object, col_name)
+
+        start = file_object.tell()
+        size = file_object.seek(0, io.SEEK_END) - start
+        file_object.seek(start)
+
+        pk_values = [getattr(record_object, pk) for pk in statements.pk_col_names]
+        md5 = hashlib.md5()
+
+        # a batch, so the blob is opened on the connection holding the preallocated row
+        with DatabaseConnection(self, con_type=ConType.batch):
+            sql = f'UPDATE {statements.table_name} SET {col_name}=zeroblob(?) WHERE {statements.pk_condition};'
+
+            logging.info('WRITE BLOB: %s %s', sql, [size] + pk_values)
+
+            self.__invalidate__(statements.table_name)
+
+            self.cur.execute(sql, [size] + pk_values)
+
+            with self.open_blob(record_object, col_name, readonly=False) as blob:
+                for chunk in iter(lambda: file_object.read(chunk_size), b''):
+                    md5.update(chunk)
+                    blob.write(chunk)
+
+            if md5_col_name is not None:
+                self.cur.execute(f'UPDATE {statements.table_name} SET {md5_col_name}=? WHERE {statements.pk_condition};',
+                                 [md5.hexdigest()] + pk_values)
+
+        # the blob is not kept in memory, but loaded from the database when accessed
+        record_object.__unload_column__(self, col_name)
+
+        if md5_col_name is not None:
+            record_object.__set_loaded_values__((md5_col_name,), (md5.hexdigest(),), overwrite=True)
+
+        return md5.hexdigest()
+
+    def read_blob(self, record_object: Table.__subclasses__, col_name: str, file_object, chunk_size: int=BLOB_CHUNK_SIZE) -> str:
+        """Streams a blob column of a record into a file object, chunk by chunk, and returns its md5"""
+
+        md5 = hashlib.md5()
+
+        with self.open_blob(record_object, col_name) as blob:
+            for chunk in iter(lambda: blob.read(chunk_size), b''):
+                md5.update(chunk)
+                file_object.write(chunk)
+
+        return md5.hexdigest()
+
     def increment_id(self, table_name: str, column_name: str= 'id') -> int:
 
         try:
@@ -0,0 +1,81 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import sqlite3 as sqlite
+from typing import Any, Dict, Union
+
+
+class PragmaProfile:
+    """ A set of sqlite pragmas applied to every new connection, and optionally for the duration of a batch """
+
+    profiles: Dict[str, 'PragmaProfile'] = dict()
+
+    def __init__(self, pragmas: Dict[str, Any]=None, batch_pragmas: Dict[str, Any]=None):
+        self.pragmas: Dict[str, Any] = dict(pragmas or {})
+        self.batch_pragmas: Dict[str, Any] = dict(batch_pragmas or {})
+
+    def __repr__(self) -> str:
+        return f'PragmaProfile({self.pragmas}, batch_pragmas={self.batch_pragmas})'
+
+    @classmethod
+    def resolve(cls, profile: Union[str, Dict[str, Any], 'PragmaProfile', None]) -> 'PragmaProfile':
+        """ Returns a PragmaProfile from a profile name, a dict of pragmas or a PragmaProfile """
+
+        if profile is None:
+            return cls()
+
+        if isinstance(profile, PragmaProfile):
+            return profile
+
+        if isinstance(profile, dict):
+            return cls(profile)
+
+        if profile not in cls.profiles:
+            raise ValueError(f'Unknown pragma profile: {profile}. Choose from {", ".join(cls.profiles)}')
+
+        return cls.profiles[profile]
+
+    @staticmethod
+    def __set_pragmas__(con: sqlite.Connection, pragmas: Dict[str, Any]) -> Dict[str, Any]:
+        """ Sets the pragmas and returns their previous values """
+
+        previous_values = dict()
+
+        for name, value in pragmas.items():
+            previous_values[name] = con.execute(f'PRAGMA {name}').fetchone()[0]
+            con.execute(f'PRAGMA {name}={value}')
+
+        return previous_values
+
+    def apply(self, con: sqlite.Connection) -> None:
+        """ Applies the connection pragmas to a new connection """
+
+        for name, value in self.pragmas.items():
+            con.execute(f'PRAGMA {name}={value}')
+
+    def begin_batch(self, con: sqlite.Connection) -> Dict[str, Any]:
+        """ Applies the batch pragmas and returns the values to restore when the batch ends """
+
+        return self.__set_pragmas__(con, self.batch_pragmas)
+
+    def end_batch(self, con: sqlite.Connection, previous_values: Dict[str, Any]) -> None:
+
+        self.__set_pragmas__(con, previous_values)
+
+
+PragmaProfile.profiles['default'] = PragmaProfile()
+
+PragmaProfile.profiles['durable'] = PragmaProfile({'journal_mode': 'DELETE',
+                                                   'synchronous': 'FULL'})
+
+PragmaProfile.profiles['throughput'] = PragmaProfile({'journal_mode': 'WAL',
+                                                      'synchronous': 'NORMAL',
+                                                      'cache_size': -64000,
+                                                      'mmap_size': 268435456,
+                                                      'temp_store': 'MEMORY'})
+
+PragmaProfile.profiles['bulk-load'] = PragmaProfile({'synchronous': 'NORMAL',
+                                                     'cache_size': -64000,
+                                                     'temp_store': 'MEMORY'},
+                                                    batch_pragmas={'journal_mode': 'OFF',
+                                                                   'synchronous': 'OFF'})
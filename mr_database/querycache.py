@@ -0,0 +1,171 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, Hashable, Mapping, Optional, Set, Tuple
+
+
+class QueryCache:
+    """ Caches the rows of select statements, keyed by the normalized sql and its params.
+    Entries are evicted least recently used beyond max_size, and expire after ttl seconds (if given).
+    MrDatabase invalidates the entries of a table whenever it writes to that table. Writes of other connections
+    are checked for at most every sync_interval seconds per thread (see MrDatabase(track_changes=True)) """
+
+    # a table name, bare or quoted, optionally prefixed with its schema
+    name_pattern = r'(?:"[^"]+"|`[^`]+`|\[[^\]]+\]|[A-Za-z_]\w*)'
+    # a table with an optional alias
+    table_ref = rf'(?:{name_pattern}\s*\.\s*)?{name_pattern}(?:\s+(?:AS\s+)?{name_pattern})?'
+    table_ref_pattern = re.compile(rf'(?:{name_pattern}\s*\.\s*)?({name_pattern})(?:\s+(?:AS\s+)?{name_pattern})?', re.IGNORECASE)
+    # the comma separated tables following FROM or JOIN, or following a subquery in a FROM list.
+    # A name taken for a table by mistake only invalidates an entry more often
+    table_pattern = re.compile(rf'(?:\b(?:FROM|JOIN)\s+|\)(?:\s+(?:AS\s+)?{name_pattern})?\s*,\s*)({table_ref}(?:\s*,\s*{table_ref})*)',
+                               re.IGNORECASE)
+    mutation_pattern = re.compile(r'^\s*(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)\s+'
+                                  rf'(?:{name_pattern}\s*\.\s*)?({name_pattern})', re.IGNORECASE)
+
+    def __init__(self, max_size: int=1000, ttl: float=None, sync_interval: float=1.0):
+        self.max_size: int = max_size
+        self.ttl: Optional[float] = ttl
+        self.sync_interval: float = sync_interval
+
+        # key: (expiry time, table names, rows)
+        self.__entries__: OrderedDict = OrderedDict()
+        self.__keys_by_table__: Dict[str, Set[Hashable]] = dict()
+        self.__lock__ = threading.Lock()
+
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+        # incremented by every invalidation. Rows selected before an invalidation are not cached
+        self.generation: int = 0
+
+    def __repr__(self) -> str:
+        return f'QueryCache({len(self)} entries, hits={self.hits}, misses={self.misses}, evictions={self.evictions})'
+
+    def __len__(self) -> int:
+        return len(self.__entries__)
+
+    @staticmethod
+    def key(sql: str, params: Any, mode: str) -> Optional[Hashable]:
+        """ The cache key of a statement. None if the params can not be hashed """
+
+        if isinstance(params, Mapping):
+            params = tuple(sorted(params.items()))
+        elif params is not None:
+            params = tuple(params)
+
+        key = (mode, ' '.join(sql.split()), params)
+
+        try:
+            hash(key)
+        except TypeError:
+            return None
+
+        return key
+
+    @staticmethod
+    def is_cacheable(sql: str) -> bool:
+
+        return sql.lstrip()[:6].upper() == 'SELECT'
+
+    @staticmethod
+    def unquote(name: str) -> str:
+
+        return name[1:-1] if name[:1] in '"`[' else name
+
+    @classmethod
+    def table_names(cls, sql: str) -> FrozenSet[str]:
+        """ The tables a select statement reads from, by the tables following FROM and JOIN """
+
+        table_names = set()
+
+        for table_refs in cls.table_pattern.findall(sql):
+            for table_name in cls.table_ref_pattern.findall(table_refs):
+                table_names.add(cls.unquote(table_name).lower())
+
+        return frozenset(table_names)
+
+    @classmethod
+    def mutated_table_name(cls, sql: str) -> Optional[str]:
+        """ The table an insert, update or delete statement writes to. None if unknown """
+
+        match = cls.mutation_pattern.match(sql)
+
+        return cls.unquote(match.group(1)) if match else None
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """ Returns whether the key was found, and its rows """
+
+        with self.__lock__:
+            entry = self.__entries__.get(key)
+
+            if entry is not None:
+                if entry[0] is not None and entry[0] < time.monotonic():
+                    self.__remove__(key)
+                    self.evictions += 1
+                else:
+                    self.__entries__.move_to_end(key)
+                    self.hits += 1
+                    return True, entry[2]
+
+            self.misses += 1
+
+            return False, None
+
+    def put(self, key: Hashable, sql: str, rows: Any, generation: int) -> None:
+        """ Caches the rows of a statement, unless the cache was invalidated since generation.
+        Statements reading no table that can be found are not cached, as nothing would invalidate them """
+
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+
+        table_names = self.table_names(sql)
+
+        if not table_names:
+            return
+
+        with self.__lock__:
+            if generation != self.generation:
+                return
+
+            self.__entries__[key] = (expires, table_names, rows)
+            self.__entries__.move_to_end(key)
+
+            for table_name in table_names:
+                self.__keys_by_table__.setdefault(table_name, set()).add(key)
+
+            while len(self.__entries__) > self.max_size:
+                self.__remove__(next(iter(self.__entries__)))
+                self.evictions += 1
+
+    def __remove__(self, key: Hashable) -> None:
+        """ Removes an entry. Must be called holding the lock """
+
+        _, table_names, _ = self.__entries__.pop(key)
+
+        for table_name in table_names:
+            self.__keys_by_table__[table_name].discard(key)
+
+    def invalidate(self, *table_names: str) -> None:
+        """ Drops the entries reading from any of the tables """
+
+        with self.__lock__:
+            self.generation += 1
+
+            for table_name in table_names:
+                for key in tuple(self.__keys_by_table__.get(table_name.lower(), ())):
+                    self.__remove__(key)
+
+    def clear(self) -> None:
+
+        with self.__lock__:
+            self.generation += 1
+            self.__entries__.clear()
+            self.__keys_by_table__.clear()
+
+    def stats(self) -> Mapping[str, int]:
+
+        return {'entries': len(self), 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
@@ -0,0 +1,103 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import bisect
+from typing import Any, Dict, Hashable, List
+
+
+class RecordIndex:
+    """ An in-memory index of the items of a Records object by the value of one column.
+    A hash index for lookups by value, and optionally a sorted index for range lookups.
+    None values are not kept in the sorted index, and may occur more than once in a unique index """
+
+    def __init__(self, attr: str, unique: bool=False, ordered: bool=False):
+        self.attr: str = attr
+        self.unique: bool = unique
+        self.ordered: bool = ordered
+
+        # value: items with the value, in the order they were added
+        self.__items_by_value__: Dict[Hashable, List] = dict()
+
+        # id of item: the value the item was indexed with
+        self.__values__: Dict[int, Any] = dict()
+
+        # parallel lists, ordered by value
+        self.__sorted_values__: List = list()
+        self.__sorted_items__: List = list()
+
+    def __repr__(self) -> str:
+        return f'RecordIndex({self.attr}, unique={self.unique}, ordered={self.ordered})'
+
+    def check(self, value: Any) -> None:
+        """ Raises a ValueError if an item with the value can not be added to a unique index """
+
+        if self.unique and value is not None and value in self.__items_by_value__:
+            raise ValueError(f'Unique index on {self.attr} already holds {value!r}')
+
+    def build(self, items: List, values: List) -> None:
+        """ Indexes many items at once. The sorted index is sorted once """
+
+        for item, value in zip(items, values):
+            self.check(value)
+            self.__items_by_value__.setdefault(value, list()).append(item)
+            self.__values__[id(item)] = value
+
+        if self.ordered:
+            pairs = sorted(((value, item) for item, value in zip(items, values) if value is not None), key=lambda pair: pair[0])
+
+            self.__sorted_values__ = [value for value, _ in pairs]
+            self.__sorted_items__ = [item for _, item in pairs]
+
+    def add(self, item, value: Any) -> None:
+
+        self.__items_by_value__.setdefault(value, list()).append(item)
+        self.__values__[id(item)] = value
+
+        if self.ordered and value is not None:
+            position = bisect.bisect_right(self.__sorted_values__, value)
+            self.__sorted_values__.insert(position, value)
+            self.__sorted_items__.insert(position, item)
+
+    def discard(self, item) -> None:
+        """ Removes an item, by the value it was indexed with """
+
+        if id(item) not in self.__values__:
+            return
+
+        value = self.__values__[id(item)]
+        items = self.__items_by_value__[value]
+
+        for position, indexed_item in enumerate(items):
+            if indexed_item is item:
+                del items[position]
+                break
+
+        # the same item may have been added more than once
+        if not any(indexed_item is item for indexed_item in items):
+            del self.__values__[id(item)]
+
+        if not items:
+            del self.__items_by_value__[value]
+
+        if self.ordered and value is not None:
+            start = bisect.bisect_left(self.__sorted_values__, value)
+            stop = bisect.bisect_right(self.__sorted_values__, value)
+
+            for position in range(start, stop):
+                if self.__sorted_items__[position] is item:
+                    del self.__sorted_values__[position]
+                    del self.__sorted_items__[position]
+                    break
+
+    def get(self, value: Any) -> List:
+        """ Returns the items with the value """
+
+        return self.__items_by_value__.get(value, [])
+
+    def range(self, lo: Any=None, hi: Any=None) -> List:
+        """ Returns the items with lo <= value < hi, ordered by value. None for no bound """
+
+        start = 0 if lo is None else bisect.bisect_left(self.__sorted_values__, lo)
+        stop = len(self.__sorted_values__) if hi is None else bisect.bisect_left(self.__sorted_values__, hi)
+
+        return self.__sorted_items__[start:stop]
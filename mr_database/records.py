@@ -1,16 +1,25 @@
 #!/usr/bin/python3
 # -*- coding: utf-8 -*-
 
-from typing import List, Any
+from collections import OrderedDict
+from typing import Dict, List, Any, Tuple
 from mr_database.table import Table
+from mr_database.recordindex import RecordIndex
 
 
 class Records:
 
-    def __init__(self, records: List[Table.__subclasses__]):
-        self.__table_class__ = records[0].__class__
+    def __init__(self, records: List[Table.__subclasses__], table_class: Table.__subclasses__=None):
         self.__records__: List[Table.__subclasses__] = list(records)
 
+        if table_class is None and self.__records__:
+            table_class = self.__records__[0].__class__
+
+        self.__table_class__ = table_class
+
+        # column name: index, see create_index
+        self.__indexes__: Dict[str, RecordIndex] = dict()
+
     def __getitem__(self, index: int):
         return self.__records__[index]
 
@@ -18,6 +27,11 @@ class Records:
         return len(self.__records__)
 
     def __add__(self, other: List[Table.__subclasses__]):
+        other = list(other)
+
+        for value in other:
+            self.__index_item__(value)
+
         self.__records__ += other
 
     def __sub__(self, other):
@@ -31,16 +45,22 @@ class Records:
             records.sort(key=lambda x: x[attr], reverse=reverse)
 
     def append(self, value: Any) -> None:
+        self.__index_item__(value)
         self.__records__.append(value)
 
     def insert(self, index: int, value) -> None:
+        self.__index_item__(value)
         self.__records__.insert(index, value)
 
     def pop(self, index: int=-1) -> Any:
-        return self.__records__.pop(index)
+        item = self.__records__.pop(index)
+        self.__unindex_item__(item)
+
+        return item
 
     def remove(self, value) -> None:
         self.__records__.remove(value)
+        self.__unindex_item__(value)
 
     def table_class(self):
         return self.__table_class__
@@ -48,14 +68,277 @@ class Records:
     def index(self, value: Any, start: int=0, stop: int=None) -> int:
         return self.__records__.index(value, start, stop)
 
-    def max(self):
-        raise NotImplementedError
+    def __aggregate__(self, col_name: str, function) -> Any:
+        """ Computes an aggregate over the values the records hold, ignoring None like sqlite does.
+        Use MrDatabase.aggregate to aggregate in sqlite """
+
+        values = [value for value in self.column(col_name) if value is not None]
+
+        return function(values) if values else None
 
-    def min(self):
-        raise NotImplementedError
+    def max(self, col_name: str) -> Any:
+        return self.__aggregate__(col_name, max)
+
+    def min(self, col_name: str) -> Any:
+        return self.__aggregate__(col_name, min)
+
+    def sum(self, col_name: str) -> Any:
+        return self.__aggregate__(col_name, sum)
 
     def first(self):
         return self.__records__[0]
 
     def last(self):
         return self.__records__[-1]
+
+    def value(self, index: int, col_name: str) -> Any:
+        """ Returns the value of a column of the nth record """
+
+        return getattr(self.__records__[index], col_name)
+
+    def column(self, col_name: str) -> List[Any]:
+        """ Returns the values of a column of all records """
+
+        return [getattr(record, col_name) for record in self.__records__]
+
+    def __record__(self, item) -> Table.__subclasses__:
+        return item
+
+    def __item_value__(self, item, col_name: str) -> Any:
+        return getattr(item, col_name)
+
+    def create_index(self, attr: str, unique: bool=False, ordered: bool=False) -> None:
+        """ Indexes the records by the value of a column, for get_by and filter_by. Ordered indexes also serve range.
+        Indexes are kept up to date when records are added or removed. Changing the indexed column of a record
+        in the records is not seen, create the index again afterwards. A unique index raises a ValueError
+        on duplicate values """
+
+        if attr not in self.__table_class__.get_schema().col_indices:
+            raise ValueError(f'{self.__table_class__.get_table_name()} has no column named {attr}')
+
+        index = RecordIndex(attr, unique, ordered)
+        index.build(self.__records__, [self.__item_value__(item, attr) for item in self.__records__])
+
+        self.__indexes__[attr] = index
+
+    def drop_index(self, attr: str) -> None:
+
+        self.__indexes__.pop(attr, None)
+
+    def __rebuild_indexes__(self) -> None:
+
+        for index in tuple(self.__indexes__.values()):
+            self.create_index(index.attr, index.unique, index.ordered)
+
+    def __index_item__(self, item) -> None:
+        """ Adds an item to the indexes. Checks all unique indexes first, so a duplicate leaves them unchanged """
+
+        if not self.__indexes__:
+            return
+
+        values = [(index, self.__item_value__(item, index.attr)) for index in self.__indexes__.values()]
+
+        for index, value in values:
+            index.check(value)
+
+        for index, value in values:
+            index.add(item, value)
+
+    def __unindex_item__(self, item) -> None:
+
+        for index in self.__indexes__.values():
+            index.discard(item)
+
+    def filter_by(self, attr: str, value: Any) -> List[Table.__subclasses__]:
+        """ Returns the records with the value. Uses the index on attr if any, otherwise scans the records """
+
+        index = self.__indexes__.get(attr)
+
+        if index is None:
+            return [self.__record__(item) for item in self.__records__ if self.__item_value__(item, attr) == value]
+
+        return [self.__record__(item) for item in index.get(value)]
+
+    def get_by(self, attr: str, value: Any) -> Table.__subclasses__:
+        """ Returns the first record with the value, or None """
+
+        index = self.__indexes__.get(attr)
+
+        if index is None:
+            return next((self.__record__(item) for item in self.__records__ if self.__item_value__(item, attr) == value), None)
+
+        items = index.get(value)
+
+        return self.__record__(items[0]) if items else None
+
+    def range(self, attr: str, lo: Any=None, hi: Any=None) -> List[Table.__subclasses__]:
+        """ Returns the records with lo <= value < hi, ordered by value. None for no bound.
+        Uses the index on attr if it is ordered, otherwise scans and sorts the records """
+
+        index = self.__indexes__.get(attr)
+
+        if index is not None and index.ordered:
+            return [self.__record__(item) for item in index.range(lo, hi)]
+
+        items = [(value, item) for value, item in ((self.__item_value__(item, attr), item) for item in self.__records__)
+                 if value is not None and (lo is None or lo <= value) and (hi is None or value < hi)]
+
+        items.sort(key=lambda value_item: value_item[0])
+
+        return [self.__record__(item) for _, item in items]
+
+    def fetch_join_tables(self, db_object: 'MrDatabase', join_table_names: List[str]=None) -> None:
+        """ Attaches the join table records to all records, with one query per join table """
+
+        db_object.fetch_join_tables(self.__records__, join_table_names)
+
+    def load_columns(self, db_object: 'MrDatabase', col_names: List[str]=None) -> None:
+        """ Loads deferred or unselected columns for all records at once """
+
+        db_object.load_columns(self.__records__, col_names)
+
+
+class RowRecords(Records):
+    """ Records holding the sql rows they were selected with. Column values are read from the rows,
+    and a record object is only built when an item is accessed. The last cache_size records built are kept,
+    keep a reference to the records you change. Records added with append or insert are kept as they are """
+
+    def __init__(self, rows: List[Tuple], table_class: Table.__subclasses__, db_object: 'MrDatabase', col_names: Tuple[str]=None, cache_size: int=128):
+        super().__init__(rows, table_class)
+
+        self.__db_object__ = db_object
+        self.__col_names__: Tuple[str] = col_names
+        self.__col_indices__ = {col_name: index for index, col_name in enumerate(col_names or table_class.get_col_names())}
+
+        # values of compressed and dedup columns are read from their records
+        for col_name in table_class.get_schema().encoded_col_names:
+            self.__col_indices__.pop(col_name, None)
+
+        self.cache_size: int = cache_size
+
+        # id of row: record
+        self.__cache__: OrderedDict = OrderedDict()
+
+    def __record__(self, item) -> Table.__subclasses__:
+        """ Returns the record of an item, building it from the row if the item is a row """
+
+        if isinstance(item, Table):
+            return item
+
+        key = id(item)
+        record = self.__cache__.get(key)
+
+        if record is not None:
+            self.__cache__.move_to_end(key)
+            return record
+
+        record = self.__db_object__.__create_record__(self.__table_class__, item, self.__col_names__)
+        self.__cache__[key] = record
+
+        if len(self.__cache__) > self.cache_size:
+            self.__cache__.popitem(last=False)
+
+        return record
+
+    def __records_of__(self, items: List) -> List[Table.__subclasses__]:
+
+        return [self.__record__(item) for item in items]
+
+    def __getitem__(self, index: int):
+
+        if isinstance(index, slice):
+            return self.__records_of__(self.__records__[index])
+
+        return self.__record__(self.__records__[index])
+
+    def __forget__(self, item) -> None:
+
+        if not isinstance(item, Table):
+            self.__cache__.pop(id(item), None)
+
+    def __position__(self, value: Table.__subclasses__, start: int=0, stop: int=None) -> int:
+        """ Returns the position of a record, which may be held as its row """
+
+        items = self.__records__
+        stop = len(items) if stop is None else stop
+
+        for position in range(*slice(start, stop).indices(len(items))):
+            item = items[position]
+
+            if item is value or (not isinstance(item, Table) and self.__cache__.get(id(item)) is value):
+                return position
+
+        raise ValueError(f'{value} is not in records')
+
+    def __item_value__(self, item, col_name: str) -> Any:
+
+        if isinstance(item, Table):
+            return getattr(item, col_name)
+
+        index = self.__col_indices__.get(col_name)
+
+        if index is None:
+            return getattr(self.__record__(item), col_name)
+
+        record = self.__cache__.get(id(item))
+
+        # a record built from the row may have been changed
+        return item[index] if record is None else getattr(record, col_name)
+
+    def value(self, index: int, col_name: str) -> Any:
+
+        return self.__item_value__(self.__records__[index], col_name)
+
+    def column(self, col_name: str) -> List[Any]:
+
+        return [self.__item_value__(item, col_name) for item in self.__records__]
+
+    def sort(self, attribute_index: int, reverse: bool=False) -> None:
+
+        if self.__records__:
+            attr: str = self.__table_class__.get_attr_name_by_index(attribute_index)
+            self.__records__.sort(key=lambda item: self.__item_value__(item, attr), reverse=reverse)
+
+    def pop(self, index: int=-1) -> Any:
+
+        item = self.__records__[index]
+        record = self.__record__(item)
+
+        super().pop(index)
+        self.__forget__(item)
+
+        return record
+
+    def remove(self, value) -> None:
+
+        self.pop(self.__position__(value))
+
+    def index(self, value: Any, start: int=0, stop: int=None) -> int:
+
+        return self.__position__(value, start, stop)
+
+    def first(self):
+        return self[0]
+
+    def last(self):
+        return self[-1]
+
+    def __materialize__(self) -> List[Table.__subclasses__]:
+        """ Builds the records of all rows, and keeps them instead of the rows """
+
+        self.__records__[:] = self.__records_of__(self.__records__)
+        self.__cache__.clear()
+        self.__rebuild_indexes__()
+
+        return self.__records__
+
+    def fetch_join_tables(self, db_object: 'MrDatabase', join_table_names: List[str]=None) -> None:
+        """ Attaches the join table records to all records, with one query per join table.
+        The records of all rows are built and kept """
+
+        db_object.fetch_join_tables(self.__materialize__(), join_table_names)
+
+    def load_columns(self, db_object: 'MrDatabase', col_names: List[str]=None) -> None:
+        """ Loads deferred or unselected columns for all records at once. The records of all rows are built and kept """
+
+        db_object.load_columns(self.__materialize__(), col_names)
@@ -0,0 +1,88 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+from types import MappingProxyType
+from typing import Dict, Tuple
+
+from mr_database.column import Column
+
+
+class Schema:
+    """ Immutable description of a table class, compiled once when the class is defined """
+
+    __slots__ = ('table_name',
+                 'col_names',
+                 'columns',
+                 'named_col_pairs',
+                 'col_indices',
+                 'display_names',
+                 'defaults',
+                 'pk_col_names',
+                 'int_pk_col_names',
+                 'fk_col_names',
+                 'deferred_col_names',
+                 'eager_col_names',
+                 'compressed_columns',
+                 'dedup_col_names',
+                 'encoded_col_names',
+                 'join_table_definitions')
+
+    def __init__(self, table_class: 'Table.__subclasses__'):
+
+        named_columns = tuple((attr, value) for attr, value in table_class.__dict__.items() if isinstance(value, Column))
+
+        col_names: Tuple[str] = tuple(name for name, _ in named_columns)
+        columns: Tuple[Column] = tuple(column for _, column in named_columns)
+
+        join_table_definitions: Dict[str, Dict] = dict()
+
+        for name, column in named_columns:
+
+            if not column.fk:
+                continue
+
+            if hasattr(column, 'fk_table'):
+                join_table_class = column.fk_table
+                fk_table_name = column.fk_table.__name__
+            else:
+                # self referencing table
+                join_table_class = table_class
+                fk_table_name = column.fk_table_name
+
+            join_table_definitions[fk_table_name] = MappingProxyType({'table_class': join_table_class,
+                                                                      'fk': column.fk_property,
+                                                                      'property': name,
+                                                                      'column': column})
+
+        compiled = {'table_name': table_class.__name__,
+                    'col_names': col_names,
+                    'columns': columns,
+                    'named_col_pairs': tuple(zip(columns, col_names)),
+                    'col_indices': MappingProxyType({name: index for index, name in enumerate(col_names)}),
+                    'display_names': tuple(column.display_name if column.display_name is not None else name
+                                           for name, column in named_columns),
+                    'defaults': tuple(column.default for column in columns),
+                    'pk_col_names': tuple(name for name, column in named_columns if column.pk),
+                    'int_pk_col_names': tuple(name for name, column in named_columns
+                                              if column.pk and column.data_type == Column.data_types.integer),
+                    'fk_col_names': tuple(name for name, column in named_columns if column.fk),
+                    'deferred_col_names': tuple(name for name, column in named_columns if column.deferred),
+                    'eager_col_names': tuple(name for name, column in named_columns if not column.deferred),
+                    'compressed_columns': MappingProxyType({name: column for name, column in named_columns
+                                                            if column.is_compressed}),
+                    'dedup_col_names': tuple(name for name, column in named_columns if column.dedup),
+                    'encoded_col_names': tuple(name for name, column in named_columns
+                                               if column.is_compressed or column.dedup),
+                    'join_table_definitions': MappingProxyType(join_table_definitions)}
+
+        for name, value in compiled.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name: str, value) -> None:
+        raise AttributeError(f'Schema of {self.table_name} is immutable')
+
+    def __repr__(self) -> str:
+        return f'Schema({self.table_name}: {", ".join(self.col_names)})'
+
+    def __len__(self) -> int:
+        return len(self.col_names)
@@ -0,0 +1,219 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Tuple
+
+from mr_database.mrdatabase import MrDatabase, Params
+from mr_database.records import Records
+from mr_database.table import Table
+
+
+class Session:
+    """ An identity map on top of a MrDatabase. Every row is represented by one record object per session.
+    Lookups by primary key return the cached record without a query, and selects return the cached record
+    for rows already in the map, including its unsaved changes. With max_size, the least recently used
+    records are evicted. A session is meant to be used from one thread """
+
+    def __init__(self, db_object: MrDatabase, max_size: int=None):
+        self.db_object: MrDatabase = db_object
+        self.max_size: Optional[int] = max_size
+
+        self.__identity_map__: OrderedDict = OrderedDict()
+
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def __repr__(self) -> str:
+        return f'Session({len(self)} records, hits={self.hits}, misses={self.misses})'
+
+    def __len__(self) -> int:
+        return len(self.__identity_map__)
+
+    def __contains__(self, record_object: Table.__subclasses__) -> bool:
+        key = self.__key__(record_object)
+
+        return key is not None and self.__identity_map__.get(key) is record_object
+
+    @staticmethod
+    def __key__(record_object: Table.__subclasses__) -> Optional[Tuple]:
+        """ The identity of a record: its table class and primary key values. None if it has none yet """
+
+        pk_col_names = record_object.get_pk_col_names()
+
+        if not pk_col_names:
+            return None
+
+        pk_values = tuple(getattr(record_object, pk) for pk in pk_col_names)
+
+        if None in pk_values:
+            return None
+
+        return record_object.__class__, pk_values
+
+    def __remember__(self, record_object: Table.__subclasses__) -> Table.__subclasses__:
+        """ Adds a record to the identity map and returns the record representing its row """
+
+        if record_object is None:
+            return None
+
+        key = self.__key__(record_object)
+
+        if key is None:
+            return record_object
+
+        identity_map = self.__identity_map__
+        cached = identity_map.get(key)
+
+        if cached is not None:
+            identity_map.move_to_end(key)
+            return cached
+
+        identity_map[key] = record_object
+
+        if self.max_size is not None and len(identity_map) > self.max_size:
+            identity_map.popitem(last=False)
+
+        return record_object
+
+    def evict(self, record_object: Table.__subclasses__) -> None:
+        """ Removes a record from the identity map. Its row is selected again on the next lookup """
+
+        key = self.__key__(record_object)
+
+        if key is not None and self.__identity_map__.get(key) is record_object:
+            del self.__identity_map__[key]
+
+    def evict_table(self, table_class: Table.__subclasses__) -> None:
+        """ Removes all records of a table class from the identity map, e.g. after writing rows by a condition """
+
+        for key in [key for key in self.__identity_map__ if key[0] is table_class]:
+            del self.__identity_map__[key]
+
+    def clear(self) -> None:
+
+        self.__identity_map__.clear()
+
+    def get(self, table_class: Table.__subclasses__, *pk_values) -> Table.__subclasses__:
+        """ Returns the record with the given primary key values, from the identity map if possible """
+
+        key = (table_class, pk_values)
+        cached = self.__identity_map__.get(key)
+
+        if cached is not None:
+            self.hits += 1
+            self.__identity_map__.move_to_end(key)
+            return cached
+
+        self.misses += 1
+
+        return self.__remember__(self.db_object.select_record_by_pk(table_class, *pk_values))
+
+    def select_record(self, table_class: Table.__subclasses__, condition: str, params: Params=None, columns: Iterable[str]=None) -> Table.__subclasses__:
+
+        return self.__remember__(self.db_object.select_record(table_class, condition, params, columns))
+
+    def select_records(self, table_class: Table.__subclasses__, condition: str=None, order_by: List[str]=None, order_asc: bool=True, limit: int=0, params: Params=None, columns: Iterable[str]=None) -> Records:
+
+        records = self.db_object.select_records(table_class, condition, order_by, order_asc, limit, params, columns)
+
+        return Records([self.__remember__(record_object) for record_object in records], table_class)
+
+    def select_join_record(self, record_object: Table.__subclasses__, join_table_name: str) -> Table.__subclasses__:
+        """ Returns the record of a join table. Foreign keys to a primary key are looked up in the identity map """
+
+        fk_table_info = record_object.__join_table_definitions__.get(join_table_name)
+
+        if fk_table_info is None:
+            return None
+
+        join_table_class = fk_table_info['table_class']
+        value = getattr(record_object, fk_table_info['property'])
+
+        if value is None:
+            return None
+
+        if join_table_class.get_pk_col_names() == (fk_table_info['fk'],):
+            return self.get(join_table_class, value)
+
+        return self.__remember__(record_object.select_join_record(self.db_object, join_table_name))
+
+    def insert_record(self, record_object: Table.__subclasses__) -> str:
+
+        sql = self.db_object.insert_record(record_object)
+        self.__remember__(record_object)
+
+        return sql
+
+    def insert_records(self, record_objects: Iterable[Table.__subclasses__]) -> List[str]:
+
+        record_objects = list(record_objects)
+        sql_statements = self.db_object.insert_records(record_objects)
+
+        for record_object in record_objects:
+            self.__remember__(record_object)
+
+        return sql_statements
+
+    def update_record(self, record_object: Table.__subclasses__, condition: str=None, params: Params=None) -> str:
+
+        sql = self.db_object.update_record(record_object, condition, params)
+
+        if self.__writes_by_pk__(record_object, condition):
+            self.__replace__(record_object)
+        else:
+            self.evict_table(record_object.__class__)
+
+        return sql
+
+    def update_records(self, record_objects: Iterable[Table.__subclasses__]) -> List[str]:
+
+        record_objects = list(record_objects)
+        sql_statements = self.db_object.update_records(record_objects)
+
+        for record_object in record_objects:
+            self.__replace__(record_object)
+
+        return sql_statements
+
+    def upsert_records(self, record_objects: Iterable[Table.__subclasses__], conflict_column: str=None) -> List[str]:
+
+        record_objects = list(record_objects)
+        sql_statements = self.db_object.upsert_records(record_objects, conflict_column)
+
+        for record_object in record_objects:
+            self.__replace__(record_object)
+
+        return sql_statements
+
+    def upsert_record(self, record_object: Table.__subclasses__, conflict_column: str=None) -> str:
+
+        return self.upsert_records([record_object], conflict_column)[-1]
+
+    def delete_record(self, record_object: Table.__subclasses__, condition: str=None, params: Params=None) -> str:
+
+        sql = self.db_object.delete_record(record_object, condition, params)
+
+        key = self.__key__(record_object)
+
+        if not self.__writes_by_pk__(record_object, condition):
+            self.evict_table(record_object.__class__)
+        elif key is not None:
+            self.__identity_map__.pop(key, None)
+
+        return sql
+
+    @staticmethod
+    def __writes_by_pk__(record_object: Table.__subclasses__, condition: Optional[str]) -> bool:
+        """ True if an update or delete of the record writes its own row only. Other conditions may match any rows """
+
+        return condition is None and MrDatabase.__has_default_condition__(record_object)
+
+    def __replace__(self, record_object: Table.__subclasses__) -> None:
+        """ The record just written represents its row from now on """
+
+        key = self.__key__(record_object)
+
+        if key is not None:
+            self.__identity_map__.pop(key, None)
+            self.__remember__(record_object)
@@ -0,0 +1,104 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+from typing import Dict, Tuple
+
+
+class Statements:
+    """ The sql statements and column metadata of a table class, compiled once and reused for every record.
+    Reusing the exact same statement text lets sqlite's prepared statement cache hit every time """
+
+    def __init__(self, table_class: 'Table.__subclasses__'):
+
+        schema = table_class.get_schema()
+
+        self.table_name: str = schema.table_name
+
+        self.col_names: Tuple[str] = schema.col_names
+        self.pk_col_names: Tuple[str] = schema.pk_col_names
+        self.int_pk_col_names: Tuple[str] = schema.int_pk_col_names
+
+        # integer primary keys are auto incrementing and omitted when inserting
+        self.insert_col_names: Tuple[str] = tuple(name for name in self.col_names if name not in self.int_pk_col_names)
+        self.update_col_names: Tuple[str] = tuple(name for name in self.col_names if name not in self.pk_col_names)
+
+        self.create_table: str = table_class.__create_table__()
+        self.drop_table: str = table_class.__drop_table__()
+
+        self.insert: str = f'INSERT INTO {self.table_name}({", ".join(self.insert_col_names)}) ' \
+                           f'VALUES ({", ".join(["?"] * len(self.insert_col_names))});'
+
+        self.__selects__: Dict[Tuple[str], str] = dict()
+
+        # deferred columns are left out, unless selected explicitly
+        if schema.deferred_col_names:
+            self.select_all: str = self.select_columns(schema.eager_col_names)
+        else:
+            self.select_all: str = f'SELECT * FROM {self.table_name}'
+
+        self.pk_condition: str = None
+        self.update_by_pk: str = None
+        self.select_by_pk: str = None
+        self.delete_by_pk: str = None
+
+        if self.pk_col_names:
+            self.pk_condition = " AND ".join(f'{name}=?' for name in self.pk_col_names)
+
+            self.update_by_pk = f'UPDATE {self.table_name} ' \
+                                f'SET {", ".join(f"{name}=?" for name in self.update_col_names)} ' \
+                                f'WHERE {self.pk_condition};'
+
+            self.select_by_pk = f'{self.select_all} WHERE {self.pk_condition};'
+            self.delete_by_pk = f'DELETE FROM {self.table_name} WHERE {self.pk_condition};'
+
+        self.__upserts__: Dict[str, str] = dict()
+        self.__partial_updates__: Dict[Tuple[str], str] = dict()
+
+    def __repr__(self) -> str:
+        return f'Statements({self.table_name})'
+
+    def upsert(self, conflict_col_name: str) -> str:
+        """ Returns the upsert statement for a conflict column, compiled on first use """
+
+        sql = self.__upserts__.get(conflict_col_name)
+
+        if sql is None:
+            update_col_names = [name for name in self.update_col_names if name != conflict_col_name]
+
+            if update_col_names:
+                update = ", ".join(f'{name}=excluded.{name}' for name in update_col_names)
+                on_conflict = f'ON CONFLICT({conflict_col_name}) DO UPDATE SET {update}'
+            else:
+                on_conflict = f'ON CONFLICT({conflict_col_name}) DO NOTHING'
+
+            sql = f'INSERT INTO {self.table_name}({", ".join(self.col_names)}) ' \
+                  f'VALUES ({", ".join(["?"] * len(self.col_names))}) {on_conflict};'
+
+            self.__upserts__[conflict_col_name] = sql
+
+        return sql
+
+    def select_columns(self, col_names: Tuple[str]) -> str:
+        """ Returns the select statement for a subset of the columns (without a WHERE clause), compiled on first use """
+
+        sql = self.__selects__.get(col_names)
+
+        if sql is None:
+            sql = f'SELECT {", ".join(col_names)} FROM {self.table_name}'
+            self.__selects__[col_names] = sql
+
+        return sql
+
+    def update_by_pk_for(self, col_names: Tuple[str]) -> str:
+        """ Returns the update statement for a subset of the columns, compiled on first use """
+
+        sql = self.__partial_updates__.get(col_names)
+
+        if sql is None:
+            sql = f'UPDATE {self.table_name} ' \
+                  f'SET {", ".join(f"{name}=?" for name in col_names)} ' \
+                  f'WHERE {self.pk_condition};'
+
+            self.__partial_updates__[col_names] = sql
+
+        return sql
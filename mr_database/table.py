@@ -14,19 +14,47 @@ import json
 import copy
 import sqlite3 as sqlite
 import hashlib
-from typing import Dict, Generator, List, Tuple
+from typing import Callable, Dict, Generator, List, Mapping, Tuple
 from mr_database.data_formatting import DataFormatting
 from mr_database.column import Column
+from mr_database.compact import CompactRecord, TableMeta
+from mr_database.schema import Schema
+from mr_database.statements import Statements
 
+# attribute values which can be shared by all records built by a record factory
+IMMUTABLE_TYPES = (type(None), bool, int, float, complex, str, bytes, tuple, frozenset)
 
-class Table:
-    __join_table_definitions__: Dict = dict()
-    __join_tables__: Dict = dict()
+
+class Table(metaclass=TableMeta):
+    # subclasses get an instance __dict__, unless they are compact (class City(Table, compact=True))
+    __slots__ = ()
+
+    __schema__: Schema = None
+    __join_table_definitions__: Mapping = dict()
+
+    # record state, only set on the records that need it
+    __dirty__: set = None
+    __database__: 'MrDatabase' = None
+    __encoded__: Dict = None
+    __blob_hashes__: Dict = None
+    __join_tables__: Dict = None
+
+    def __init_subclass__(cls, **kwargs):
+        """ Compiles the schema of a table class when the class is defined """
+
+        super().__init_subclass__()
+
+        cls.__schema__ = Schema(cls)
+        cls.__join_table_definitions__ = cls.__schema__.join_table_definitions
+
+    @classmethod
+    def get_schema(cls) -> Schema:
+        return cls.__schema__
 
     @classmethod
-    def __get_named_col_pairs__(cls):
+    def __get_named_col_pairs__(cls) -> Tuple[Tuple[Column, str]]:
 
-        return zip(cls.get_columns(), cls.get_col_names())
+        return cls.__schema__.named_col_pairs
 
     @classmethod
     def __create_table__(cls) -> str:
@@ -83,91 +111,342 @@ class Table:
 
         return f'DROP TABLE IF EXISTS {cls.get_table_name()};'
 
+    @classmethod
+    def get_statements(cls) -> Statements:
+        """ Returns the compiled sql statements of the table class. Compiled on first use """
+
+        statements = cls.__dict__.get('__statements__')
+
+        if statements is None:
+            statements = Statements(cls)
+            cls.__statements__ = statements
+
+        return statements
+
+    @classmethod
+    def get_record_factory(cls, col_names: Tuple[str]=None) -> Callable[[Tuple], 'Table']:
+        """ Returns the function building a clean record from a sql row of the columns (all if None).
+        Compiled on first use per selection of columns """
+
+        factories = cls.__dict__.get('__record_factories__')
+
+        if factories is None:
+            factories = dict()
+            cls.__record_factories__ = factories
+
+        factory = factories.get(col_names)
+
+        if factory is None:
+            factory = cls.__compile_record_factory__(col_names or cls.__schema__.col_names)
+            factories[col_names] = factory
+
+        return factory
+
+    @classmethod
+    def __compile_record_factory__(cls, col_names: Tuple[str]) -> Callable[[Tuple], 'Table']:
+        """ Records are created without calling __init__, and their values are set bypassing the dirty tracking
+        of __setattr__. Other attributes an overridden __init__ sets are captured once, from a template record.
+        If any of them is mutable, it could not be shared between records and __init__ is called for every record """
+
+        schema = cls.__schema__
+        new = object.__new__
+        set_value = object.__setattr__
+
+        encoded = tuple((index, col_name) for index, col_name in enumerate(col_names) if col_name in schema.encoded_col_names)
+        unselected = tuple(col_name for col_name in schema.col_names if col_name not in col_names)
+
+        if issubclass(cls, CompactRecord):
+            setters = tuple(cls.__column_slots__[col_name].__set__ for col_name in col_names)
+        else:
+            setters = None
+
+        extra_attributes = ()
+
+        if cls.__init__ is not Table.__init__ and setters is None:
+            extra_attributes = tuple((attr, value) for attr, value in cls().__dict__.items()
+                                     if attr not in schema.col_indices and not attr.startswith('__'))
+
+        if all(isinstance(value, IMMUTABLE_TYPES) for _, value in extra_attributes):
+            def create(sql_row: Tuple) -> 'Table':
+                record = new(cls)
+
+                for attr, value in extra_attributes:
+                    set_value(record, attr, value)
+
+                if setters is None:
+                    for col_name, value in zip(col_names, sql_row):
+                        set_value(record, col_name, value)
+                else:
+                    for setter, value in zip(setters, sql_row):
+                        setter(record, value)
+
+                for index, col_name in encoded:
+                    record.__set_sql_value__(col_name, sql_row[index])
+
+                return record
+
+            return create
+
+        def create_initialized(sql_row: Tuple) -> 'Table':
+            record = cls()
+            record.from_sql_record(sql_row, col_names)
+
+            for col_name in unselected:
+                record.__drop_value__(col_name)
+
+            return record
+
+        return create_initialized
+
     @classmethod
     def has_int_pk(cls) -> Tuple[str]:
-        return tuple(col_pair[1] for col_pair in cls.__get_named_col_pairs__() if col_pair[0].pk and col_pair[0].data_type == Column.data_types.integer)
+        return cls.__schema__.int_pk_col_names
 
     @classmethod
     def get_table_name(cls) -> str:
-        if issubclass(cls, Table):
-            return cls.__name__
-        else:
-            return cls.__class__.__name__
+        return cls.__schema__.table_name
 
     @classmethod
-    def get_columns(cls) -> Generator[Column, None, None]:
-        """ Returns the Column objects of a table. Using self.get_table_property_names to guarantee property order """
+    def get_columns(cls) -> Tuple[Column]:
+        """ Returns the Column objects of a table, in the order they are defined """
 
-        if issubclass(cls, Table):
-            return (value for attr, value in cls.__dict__.items() if isinstance(value, Column))
-        else:
-            return (value for attr, value in cls.__class__.__dict__.items() if isinstance(value, Column))
+        return cls.__schema__.columns
 
     @classmethod
-    def get_col_names(cls) -> Generator[str, None, None]:
+    def get_col_names(cls) -> Tuple[str]:
         """ Returns class level attribute names (excluding privates and callables) """
 
-        if issubclass(cls, Table):
-            return (attr for attr, value in cls.__dict__.items() if isinstance(value, Column))
-        else:
-            return (attr for attr, value in cls.__class__.__dict__.items() if isinstance(value, Column))
+        return cls.__schema__.col_names
 
     @classmethod
     def get_col_display_names(cls) -> Tuple[str]:
         """ Returns the display names of each column if they exist. Fallback is attribute name """
 
-        display_names: Generator[str, None, None] \
-            = (getattr(cls, col_name).display_name if getattr(cls, col_name).display_name is not None else col_name
-               for col_name in cls.get_col_names())
-
-        return tuple(display_names)
+        return cls.__schema__.display_names
 
     @classmethod
     def get_attr_name_by_index(cls, index) -> str:
-        return list(cls.get_col_names())[index]
+        return cls.__schema__.col_names[index]
+
+    @classmethod
+    def get_pk_col_names(cls) -> Tuple[str]:
+        return cls.__schema__.pk_col_names
 
     @staticmethod
     def read_blob_file(data):
         return sqlite.Binary(data.read())
 
     @staticmethod
-    def md5_file_object(file_object) -> str:
-        md5 = hashlib.md5(file_object.read()).hexdigest()
-        file_object.seek(0)
-        return md5
+    def md5_file_object(file_object, chunk_size: int=1024 * 1024) -> str:
+        """ Returns the md5 of a file object, read in chunks. The file position is restored """
+
+        start = file_object.tell()
+        md5 = hashlib.md5()
+
+        for chunk in iter(lambda: file_object.read(chunk_size), b''):
+            md5.update(chunk)
+
+        file_object.seek(start)
+        return md5.hexdigest()
 
     def __init__(self):
         self.__setup_default_value__()
-        self.__init_join_tables__()
 
-    def __setup_default_value__(self):
-        [setattr(self, prop_name, column.default) for column, prop_name in self.__get_named_col_pairs__()]
-
-    def __init_join_tables__(self):
+    def __setattr__(self, name: str, value) -> None:
+        """ Setting a column attribute marks the column dirty """
 
-        for column, prop_name in self.__get_named_col_pairs__():
+        object.__setattr__(self, name, value)
 
-            if not column.fk:
-                continue
+        if name in self.__schema__.col_indices:
+            dirty = self.__dirty__
 
-            if hasattr(column, 'fk_table'):
-                join_table_class = column.fk_table
-                fk_table_name = column.fk_table.__name__
+            if dirty is None:
+                object.__setattr__(self, '__dirty__', {name})
             else:
-                join_table_class = self.__class__
-                fk_table_name = column.fk_table_name
+                dirty.add(name)
+
+    def is_dirty(self) -> bool:
+        """ True if any column changed since the record was loaded or last saved """
+
+        return bool(self.__dirty__)
+
+    def get_dirty_col_names(self) -> Tuple[str]:
+        """ Returns the names of the columns changed since the record was loaded or last saved, in column order """
+
+        dirty = self.__dirty__
+
+        if not dirty:
+            return ()
+
+        return tuple(name for name in self.__schema__.col_names if name in dirty)
+
+    def is_loaded(self, col_name: str) -> bool:
+        """ False for deferred or unselected columns not yet loaded from the database """
+
+        return self.__has_value__(col_name) or col_name in (self.__encoded__ or ())
+
+    def __has_value__(self, col_name: str) -> bool:
+        """ True if the record holds a value for the column, without loading it """
+
+        return col_name in self.__dict__
+
+    def __peek_value__(self, col_name: str):
+        """ Returns the value the record holds for a column, without loading it. None if it holds none """
+
+        return self.__dict__.get(col_name)
 
-            # todo : simplify the dict . . just the column is needed
-            self.__join_table_definitions__[fk_table_name] = {'table_class': join_table_class,
-                                                              'fk': column.fk_property,
-                                                              'property': prop_name,
-                                                              'column': column}
+    def __drop_value__(self, col_name: str) -> None:
+
+        self.__dict__.pop(col_name, None)
+
+    def __load_column__(self, col_name: str):
+        """ Called by the Column descriptor when the record has no value for the column """
+
+        db_object = self.__database__
+
+        if col_name not in (self.__encoded__ or ()):
+
+            if db_object is None:
+                return self.__schema__.columns[self.__schema__.col_indices[col_name]]
+
+            db_object.load_columns([self], (col_name,))
+
+            if col_name not in (self.__encoded__ or ()):
+                return self.__peek_value__(col_name)
+
+        if col_name in self.__schema__.dedup_col_names:
+            if db_object is None:
+                return self.__schema__.columns[self.__schema__.col_indices[col_name]]
+
+            return self.__decode_column__(col_name, db_object.select_blob(self.__encoded__[col_name]))
+
+        return self.__decode_column__(col_name, self.__encoded__[col_name])
+
+    def __get_state__(self, name: str) -> Dict:
+        """ Returns a dict of the record state (e.g. __encoded__), created on first use """
+
+        state = getattr(self, name)
+
+        if state is None:
+            state = dict()
+            object.__setattr__(self, name, state)
+
+        return state
+
+    def __decode_column__(self, col_name: str, stored_value):
+        """ Decodes a value stored by __set_sql_value__, on first access of the attribute """
+
+        column = self.__schema__.columns[self.__schema__.col_indices[col_name]]
+        value = column.from_sql(stored_value)
+        encoded_value = self.__encoded__.pop(col_name)
+
+        if column.dedup:
+            self.__get_state__('__blob_hashes__')[col_name] = (value, encoded_value)
+
+        object.__setattr__(self, col_name, value)
+
+        return value
+
+    def __set_sql_value__(self, col_name: str, value) -> None:
+        """ Sets a value as stored in the database. Compressed values and blob hashes are kept as is,
+        until the attribute is first accessed """
+
+        if value is not None and col_name in self.__schema__.encoded_col_names:
+            self.__drop_value__(col_name)
+            self.__get_state__('__encoded__')[col_name] = value
+        else:
+            object.__setattr__(self, col_name, value)
+
+    def __blob_hash__(self, col_name: str) -> str:
+        """ Returns the content hash of the value of a dedup column, cached until the value is replaced """
+
+        value = getattr(self, col_name)
+
+        if value is None:
+            return None
+
+        blob_hashes = self.__get_state__('__blob_hashes__')
+        cached = blob_hashes.get(col_name)
+
+        if cached is not None and cached[0] is value:
+            return cached[1]
+
+        content_hash = Column.content_hash(value)
+        blob_hashes[col_name] = (value, content_hash)
+
+        return content_hash
+
+    def __sql_value__(self, col_name: str):
+        """ Returns the value of a compressed or dedup column, as stored in the database """
+
+        if not self.__has_value__(col_name):
+            encoded = self.__encoded__
+
+            # not accessed since it was loaded, so still encoded
+            if encoded and col_name in encoded:
+                return encoded[col_name]
+
+        if col_name in self.__schema__.dedup_col_names:
+            return self.__blob_hash__(col_name)
+
+        return self.__schema__.compressed_columns[col_name].to_sql(getattr(self, col_name))
+
+    def get_sql_values(self, col_names: Tuple[str]) -> List:
+        """ Returns the values of the columns, as stored in the database """
+
+        encoded_col_names = self.__schema__.encoded_col_names
+
+        if not encoded_col_names:
+            return [getattr(self, col_name) for col_name in col_names]
+
+        return [self.__sql_value__(col_name) if col_name in encoded_col_names
+                else getattr(self, col_name) for col_name in col_names]
+
+    def __set_loaded_values__(self, col_names: Tuple[str], values: Tuple, overwrite: bool=False) -> None:
+        """ Sets values loaded from the database, without marking them dirty.
+        Unless overwrite, columns already loaded (and maybe changed) are kept """
+
+        for col_name, value in zip(col_names, values):
+            if overwrite or not self.is_loaded(col_name):
+                self.__set_sql_value__(col_name, value)
+
+                if overwrite and self.__dirty__:
+                    self.__dirty__.discard(col_name)
+
+    def __unload_column__(self, db_object: 'MrDatabase', col_name: str) -> None:
+        """ Drops the value of a column, so it is loaded from db_object when next accessed """
+
+        self.__drop_value__(col_name)
+        (self.__encoded__ or dict()).pop(col_name, None)
+        object.__setattr__(self, '__database__', db_object)
+
+        if self.__dirty__:
+            self.__dirty__.discard(col_name)
+
+    def mark_clean(self) -> None:
+        """ Marks all columns as saved """
+
+        object.__setattr__(self, '__dirty__', None)
+
+    def mark_dirty(self, *col_names: str) -> None:
+        """ Marks columns as changed. All columns if no names are given """
+
+        object.__setattr__(self, '__dirty__', set(self.get_dirty_col_names() + (col_names or self.__schema__.col_names)))
+
+    def __setup_default_value__(self):
+        for prop_name, default in zip(self.__schema__.col_names, self.__schema__.defaults):
+            setattr(self, prop_name, default)
+
+    def __init_join_tables__(self):
+        """ The join table definitions are compiled with the schema. Kept for backwards compatibility """
+
+        pass
 
     def __getitem__(self, item):
         return getattr(self, item)
 
     def __repr__(self) -> str:
-        x = (f'{a} : {b}' for a, b in zip(list(self.get_col_names()), list(self.get_values())))
+        x = (f'{a} : {self.__peek_value__(a) if self.__has_value__(a) else "<not loaded>"}' for a in self.get_col_names())
 
         repr_string = f'{self.get_table_name()} ({", ".join(x)})'
 
@@ -177,7 +456,7 @@ class Table:
         """ Gets the value of the nth attribute """
 
         try:
-            return getattr(self, list(self.get_col_names())[index])
+            return getattr(self, self.__schema__.col_names[index])
         except:
             return False
 
@@ -185,7 +464,7 @@ class Table:
         """ Sets the value of the nth attribute """
 
         try:
-            attrib = list(self.get_col_names())[index]
+            attrib = self.__schema__.col_names[index]
             setattr(self, attrib, value)
             return True
         except:
@@ -199,15 +478,21 @@ class Table:
     def get_values(self) -> Generator:
         """ Returns a generator for all the values """
 
-        return (getattr(self, column_name) for column_name in self.get_col_names())
+        return (getattr(self, column_name) for column_name in self.__schema__.col_names)
+
+    def get_join_tables(self) -> Dict[str, 'Table']:
+        """ Returns the join table records attached to this record, by join table name """
+
+        return self.__get_state__('__join_tables__')
 
     def add_table_to_join_table_dict(self, key, value) -> None:
 
-        self.__join_tables__[key] = value
+        self.get_join_tables()[key] = value
 
     def fetch_join_tables(self, db_object: 'MrDatabase') -> None:
+        """ Attaches the records of all join tables, with one query per join table """
 
-        [self.add_table_to_join_table_dict(join_table_name, self.select_join_record(db_object, join_table_name)) for join_table_name in self.__join_table_definitions__.keys()]
+        db_object.fetch_join_tables([self])
 
     def select_join_record_all(self, db_object: 'MrDatabase') -> Tuple['Table']:
         """ returning records for all join tables """
@@ -215,7 +500,8 @@ class Table:
         return tuple((self.select_join_record(db_object, join_table_name) for join_table_name in self.__join_table_definitions__.keys()))
 
     def select_join_record(self, db_object: 'MrDatabase', join_table_name: str) -> 'Table':
-        """ returning record for a specific join table """
+        """ returning record for a specific join table. Records attached by fetch_join_tables or prefetch
+        are returned without a query, as long as the foreign key still refers to them """
 
         fk_table_info = self.__join_table_definitions__.get(join_table_name)
 
@@ -223,25 +509,40 @@ class Table:
             return
 
         value = getattr(self, fk_table_info.get('property'))
-        column = fk_table_info.get('column')
+        join_tables = self.__join_tables__
+        join_record = join_tables.get(join_table_name) if join_tables else None
+
+        if join_record is not None and getattr(join_record, fk_table_info.get('fk')) == value:
+            return join_record
 
         if value is None:
             return
 
-        condition = f'{fk_table_info.get("fk")}={DataFormatting.value_to_string(column, value)}'
+        condition = f'{fk_table_info.get("fk")}=?'
+        join_record = db_object.select_record(fk_table_info.get('table_class'), condition, (value,))
 
-        return db_object.select_record(fk_table_info.get('table_class'), condition)
+        if join_tables and join_table_name in join_tables:
+            join_tables[join_table_name] = join_record
+
+        return join_record
 
     def default_update_condition(self) -> str:
-        """ Returning sql definition of default update condition """
+        """ Returning sql definition of default update condition.
+        Only used when overridden. Otherwise records are updated and deleted by their bound primary key """
 
         return f'id = {self.id}'
 
-    def from_sql_record(self, sql_row: List) -> None:
-        """ Sets the record values from a sql record of type list """
+    def from_sql_record(self, sql_row: List, col_names: Tuple[str]=None) -> None:
+        """ Sets the record values from a sql record of type list. col_names if only some columns are selected """
 
-        for column_name, value in zip(self.get_col_names(), sql_row):
-            setattr(self, column_name, value)
+        if self.__schema__.encoded_col_names:
+            for column_name, value in zip(col_names or self.__schema__.col_names, sql_row):
+                self.__set_sql_value__(column_name, value)
+        else:
+            for column_name, value in zip(col_names or self.__schema__.col_names, sql_row):
+                object.__setattr__(self, column_name, value)
+
+        self.mark_clean()
 
     def reset_to_default(self) -> None:
         """ Resets the values of the instance to the defined default values of each Column """
@@ -263,9 +564,9 @@ class Table:
         json_data = dict()
 
         json_data["table_name"] = self.get_table_name()
-        json_data["headers"] = list(self.get_col_names())
+        json_data["headers"] = list(self.__schema__.col_names)
 
-        for prop_name in self.get_col_names():
+        for prop_name in self.__schema__.col_names:
             json_data[prop_name] = getattr(self, prop_name)
 
         return json.dumps(json_data)
@@ -275,5 +576,4 @@ class Table:
         return copy.deepcopy(self)
 
 
-
-
+Table.__schema__ = Schema(Table)
@@ -0,0 +1,203 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import tracemalloc
+
+from mr_database import MrDatabase
+from mr_database import LogLevel
+from mr_database import DatabaseConnection, ConType
+from mr_database import QueryCache
+
+""" import of table classes """
+from samples.table_schema_examples import City, CompactCity
+
+DB_PATH = os.path.join(os.path.abspath(os.path.join(__file__, os.pardir)), 'test_benchmark.db')
+
+NUM_CALLS = 2000
+
+
+def reset_database(profile: str=None) -> MrDatabase:
+
+    for path in (DB_PATH, f'{DB_PATH}-wal', f'{DB_PATH}-shm'):
+        if os.path.isfile(path):
+            os.remove(path)
+
+    db = MrDatabase(DB_PATH, profile=profile)
+    db.create_table(City)
+
+    return db
+
+
+def time_per_call(action, num_calls: int=NUM_CALLS) -> float:
+    """ Returns the average time of a call in microseconds """
+
+    start = time.perf_counter()
+
+    for call_number in range(num_calls):
+        action(call_number)
+
+    return (time.perf_counter() - start) / num_calls * 1000000
+
+
+def benchmark_connection_modes() -> None:
+
+    print('\nConnect-per-call vs. persistent connection\n------------------------------------------')
+
+    for mode in ('connect-per-call', 'persistent'):
+        db = reset_database()
+
+        if mode == 'persistent':
+            db.open()
+
+        insert_time = time_per_call(lambda _: db.insert_record(City()))
+        select_time = time_per_call(lambda call_number: db.select_record(City, f'id={call_number + 1}'))
+
+        db.close()
+
+        print(f'{mode:<20} insert: {insert_time:8.1f} us/call   select: {select_time:8.1f} us/call')
+
+
+def benchmark_pragma_profiles() -> None:
+
+    print('\nPragma profiles (persistent connection)\n------------------------------------------')
+
+    for profile in ('durable', 'throughput'):
+        with reset_database(profile) as db:
+            insert_time = time_per_call(lambda _: db.insert_record(City()))
+            select_time = time_per_call(lambda call_number: db.select_record(City, f'id={call_number + 1}'))
+
+        print(f'{profile:<20} insert: {insert_time:8.1f} us/call   select: {select_time:8.1f} us/call')
+
+
+def benchmark_query_cache() -> None:
+
+    print('\nQuery cache with change tracking\n------------------------------------------')
+
+    for mode in ('connect-per-call', 'persistent'):
+        db = reset_database()
+        db.insert_records([City() for _ in range(NUM_CALLS)])
+
+        cached_db = MrDatabase(DB_PATH, query_cache=QueryCache(), track_changes=True)
+        cached_db.enable_change_tracking(City)
+
+        if mode == 'persistent':
+            db.open()
+            cached_db.open()
+
+        select_time = time_per_call(lambda call_number: db.select_record_by_pk(City, call_number % 100 + 1))
+
+        time_per_call(lambda call_number: cached_db.select_record_by_pk(City, call_number % 100 + 1), 100)
+        hit_time = time_per_call(lambda call_number: cached_db.select_record_by_pk(City, call_number % 100 + 1))
+
+        db.close()
+        cached_db.close()
+
+        print(f'{mode:<20} select: {select_time:8.1f} us/call   cache hit: {hit_time:8.1f} us/call')
+
+
+def benchmark_bulk_insert(num_records: int=100000) -> None:
+
+    print(f'\nInserting {num_records} records\n------------------------------------------')
+
+    db = reset_database()
+    cities = [City() for _ in range(num_records)]
+
+    start = time.perf_counter()
+
+    with DatabaseConnection(db, con_type=ConType.batch):
+        for city in cities:
+            db.insert_record(city)
+
+    print(f'{"insert_record batch":<20} {time.perf_counter() - start:8.3f} s')
+
+    db = reset_database()
+    cities = [City() for _ in range(num_records)]
+
+    start = time.perf_counter()
+    db.insert_records(cities)
+
+    print(f'{"insert_records":<20} {time.perf_counter() - start:8.3f} s')
+
+
+def benchmark_hydration(num_records: int=100000) -> None:
+
+    print(f'\nBuilding {num_records} records from rows\n------------------------------------------')
+
+    rows = [(index, 9999, 'New York') for index in range(num_records)]
+
+    def from_sql_record(row):
+        city = City()
+        city.from_sql_record(row)
+        return city
+
+    start = time.perf_counter()
+    [from_sql_record(row) for row in rows]
+
+    print(f'{"from_sql_record":<20} {time.perf_counter() - start:8.3f} s')
+
+    create = City.get_record_factory()
+
+    start = time.perf_counter()
+    [create(row) for row in rows]
+
+    print(f'{"record factory":<20} {time.perf_counter() - start:8.3f} s')
+
+
+def benchmark_select_columns(num_records: int=100000) -> None:
+
+    print(f'\nSelecting the columns of {num_records} records\n------------------------------------------')
+
+    db = reset_database()
+    db.insert_records([City() for _ in range(num_records)])
+
+    start = time.perf_counter()
+    records = db.select_records(City)
+    postal_codes = [city.postalCode for city in records]
+    city_names = [city.cityName for city in records]
+
+    print(f'{"select_records":<20} {time.perf_counter() - start:8.3f} s')
+
+    start = time.perf_counter()
+    columns = db.select_columns(City, ['postalCode', 'cityName'])
+
+    print(f'{"select_columns":<20} {time.perf_counter() - start:8.3f} s')
+
+    start = time.perf_counter()
+    records = db.select_records(City, lazy=True)
+    postal_codes = records.column('postalCode')
+    city_names = records.column('cityName')
+
+    print(f'{"select_records lazy":<20} {time.perf_counter() - start:8.3f} s')
+
+
+def benchmark_record_memory(num_records: int=100000) -> None:
+
+    print(f'\nMemory of {num_records} selected records\n------------------------------------------')
+
+    for table_class in (City, CompactCity):
+        db = reset_database()
+        db.create_table(table_class)
+        db.insert_records([table_class() for _ in range(num_records)])
+
+        tracemalloc.start()
+        records = db.select_records(table_class)
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print(f'{table_class.__name__:<20} {size / len(records):8.1f} bytes/record')
+
+
+if __name__ == '__main__':
+    MrDatabase.logging(level=LogLevel.error)
+
+    benchmark_connection_modes()
+    benchmark_pragma_profiles()
+    benchmark_query_cache()
+    benchmark_bulk_insert()
+    benchmark_hydration()
+    benchmark_select_columns()
+    benchmark_record_memory()
+
+    os.remove(DB_PATH)
@@ -5,7 +5,6 @@ import os
 
 from mr_database import MrDatabase
 from mr_database import LogLevel
-from mr_database import DatabaseConnection, ConType
 
 """ import of table classes """
 from samples.table_schema_examples import City
@@ -84,7 +83,7 @@ if __name__ == '__main__':
     db.insert_record(city_json)
 
     # selecting the newly inserted record
-    city3: City = db.select_record(City, condition='cityName="Frederiksberg"')
+    city3: City = db.select_record(City, condition='cityName=?', params=('Frederiksberg',))
     print('City Name: %s' % city3.cityName)
 
     # selecting and printing all cities
@@ -108,13 +107,16 @@ if __name__ == '__main__':
 
     print('\nInserting 10K clones of person_1\n------------------------------------------')
 
-    with DatabaseConnection(db, con_type=ConType.batch):
-        for clone_number in range(10000):
-            new_person = person_1.clone()
-            new_person.firstName += f'_{clone_number}'
-            db.insert_record(new_person)
+    new_persons = list()
 
-    for person in db.select_records(Person, 'id < 10'):
+    for clone_number in range(10000):
+        new_person = person_1.clone()
+        new_person.firstName += f'_{clone_number}'
+        new_persons.append(new_person)
+
+    db.insert_records(new_persons)
+
+    for person in db.select_records(Person, 'id < ?', params=(10,)):
         print(person)
 
     print('\n------------------------\nAll Tests Complete')
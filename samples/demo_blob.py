@@ -31,15 +31,16 @@ if __name__ == '__main__':
             image = Image()
 
             image.id = index
-            image.md5 = Image.md5_file_object(image_file)
             image.imageName = image_path
-            image.imageData = Image.read_blob_file(image_file)
 
             db.insert_record(image)
 
-    image2: Image = db.select_record(Image, 'id=2')
+            # streams the file into the blob column in chunks, and computes the md5 in the same pass
+            db.write_blob(image, 'imageData', image_file, md5_col_name='md5')
+
+    image2: Image = db.select_record(Image, 'id=?', (2,))
 
     with open(image2.imageName, 'wb') as file:
-        file.write(image2.imageData)
+        db.read_blob(image2, 'imageData', file)
 
     print('done')
@@ -15,6 +15,9 @@ class LocalTableModel(QtCore.QAbstractTableModel):
         self.__table__: Table.__subclasses__ = records.table_class()
         self.__headers__ = self.__records__[0].__class__.get_col_display_names()
 
+        # the change counter of the table when the records were selected. None unless the database tracks changes
+        self.__table_version__ = database.table_version(self.__table__)
+
     @property
     def database(self) -> MrDatabase:
         return self.__database__
@@ -107,3 +110,19 @@ class LocalTableModel(QtCore.QAbstractTableModel):
         self.layoutAboutToBeChanged.emit()
         self.__records__.sort(col, reverse=bool(order))
         self.layoutChanged.emit()
+
+    def refresh_if_changed(self) -> bool:
+        """Selects the records again if the table changed since, e.g. written by another process.
+        Requires MrDatabase(..., track_changes=True)"""
+
+        table_version = self.database.table_version(self.__table__)
+
+        if table_version == self.__table_version__:
+            return False
+
+        self.beginResetModel()
+        self.__records__ = self.database.select_records(self.__table__)
+        self.__table_version__ = table_version
+        self.endResetModel()
+
+        return True
@@ -39,6 +39,14 @@ class City(Table):
         self.cityName: str = City.cityName.default
 
 
+class CompactCity(Table, compact=True):
+    """ Same columns as City, but its records store their values in __slots__ """
+
+    id = Column(DataTypes.integer, pk=True)
+    postalCode = Column(DataTypes.smallint, default=9999, display_name='Postal Code')
+    cityName = Column(DataTypes.varchar(40), default='New York', display_name='City Name')
+
+
 class Person(Table):
 
     id = Column(DataTypes.integer, pk=True)
@@ -52,4 +60,4 @@ class Image(Table):
     id = Column(DataTypes.integer, pk=True)
     md5 = Column(DataTypes.char(32))
     imageName = Column(DataTypes.varchar(40))
-    imageData = Column(DataTypes.blob)
+    imageData = Column(DataTypes.blob, deferred=True)
@@ -14,6 +14,7 @@ setuptools.setup(
     long_description_content_type='text/markdown',
     url='https://github.com/SorenSeeberg/MrDatabase',
     packages=setuptools.find_packages(),
+    extras_require={'numpy': ['numpy']},
     classifiers=(
         "Programming Language :: Python :: 3.6",
         "License :: OSI Approved :: MIT License",
@@ -1,8 +1,15 @@
 #!/usr/bin/python3
 # -*- coding: utf-8 -*-
 
+import hashlib
+import io
 import os
-from mr_database import MrDatabase, Records
+import sqlite3
+import threading
+import time
+from typing import List
+from mr_database import mrdatabase
+from mr_database import MrDatabase, Records, RowRecords, Session, QueryCache
 from mr_database import DatabaseConnection
 from mr_database import ConType
 from mr_database import Table
@@ -58,13 +65,46 @@ class TagSelfRef(Table):
     parentId = Column(DataTypes.integer, fk=('TagSelfRef', 'id'), default=-1)
 
 
+class Country(Table):
+    id = Column(DataTypes.integer, pk=True)
+    code = Column(DataTypes.char(2), unique=True)
+    countryName = Column(DataTypes.varchar(40))
+
+
+class Asset(Table):
+    id = Column(DataTypes.integer, pk=True)
+    assetName = Column(DataTypes.varchar(40))
+    md5 = Column(DataTypes.char(32))
+    assetData = Column(DataTypes.blob, deferred=True)
+
+
+class Document(Table):
+    id = Column(DataTypes.integer, pk=True)
+    title = Column(DataTypes.varchar(40))
+    body = Column(DataTypes.compressed_text, codec='lzma')
+    attachment = Column(DataTypes.compressed_blob, level=9, threshold=128)
+
+
+class CatalogAsset(Table):
+    id = Column(DataTypes.integer, pk=True)
+    assetName = Column(DataTypes.varchar(40))
+    assetData = Column(DataTypes.blob, dedup=True)
+
+
+class CompactAsset(Table, compact=True):
+    id = Column(DataTypes.integer, pk=True)
+    assetName = Column(DataTypes.varchar(40), default='asset')
+    assetData = Column(DataTypes.compressed_blob, deferred=True)
+
+
 def delete_database():
 
-    if os.path.isfile(DB_PATH):
-        try:
-            os.remove(DB_PATH)
-        except IOError:
-            print('File not accessible')
+    for path in (DB_PATH, f'{DB_PATH}-wal', f'{DB_PATH}-shm'):
+        if os.path.isfile(path):
+            try:
+                os.remove(path)
+            except IOError:
+                print('File not accessible')
 
 
 def test_database_creation():
@@ -261,6 +301,1400 @@ def test_create_self_referencing_table():
     assert(tag.parentId == -1)
 
 
+def test_persistent_connection():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH)
+
+    with db:
+        db.create_table(City)
+        db.insert_record(City())
+        persistent_con = db.con
+
+        city_record: City = db.select_record(City, 'id=1')
+
+        assert(db.is_open() is True)
+        assert(db.con is persistent_con)
+        assert(city_record.id == 1)
+
+    assert(db.is_open() is False)
+    assert(db.select_record(City, 'id=1').id == 1)
+
+
+def test_persistent_memory_database():
+    db: MrDatabase = MrDatabase(':memory:').open()
+
+    db.create_table(City)
+
+    with DatabaseConnection(db, con_type=ConType.batch):
+        for _ in range(10):
+            db.insert_record(City())
+
+    assert(len(db.select_records(City)) == 10)
+
+    db.close()
+
+
+def run_concurrent_reads_and_batched_writes(db: MrDatabase, num_threads: int=8, num_batches: int=5, batch_size: int=20) -> List[Exception]:
+
+    errors = list()
+
+    def worker(thread_number: int):
+        try:
+            for batch_number in range(num_batches):
+                with DatabaseConnection(db, con_type=ConType.batch):
+                    for _ in range(batch_size):
+                        new_city = City()
+                        new_city.cityName = f'thread_{thread_number}'
+                        db.insert_record(new_city)
+
+                db.select_records(City, condition=f'cityName="thread_{thread_number}"')
+                db.select_record(City, 'id=1')
+                db.table_exists(City)
+
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=worker, args=(thread_number,)) for thread_number in range(num_threads)]
+
+    [thread.start() for thread in threads]
+    [thread.join() for thread in threads]
+
+    return errors
+
+
+def test_concurrent_reads_and_batched_writes():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH)
+    db.create_table(City)
+
+    errors = run_concurrent_reads_and_batched_writes(db)
+
+    assert(not errors)
+    assert(len(db.select_records(City)) == 8 * 5 * 20)
+
+
+def test_concurrent_reads_and_batched_writes_persistent():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH)
+    db.create_table(City)
+
+    with db:
+        errors = run_concurrent_reads_and_batched_writes(db)
+
+    assert(not errors)
+    assert(len(db.select_records(City)) == 8 * 5 * 20)
+
+
+def test_batching_is_per_database():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH)
+    other_db: MrDatabase = MrDatabase(':memory:').open()
+
+    db.create_table(City)
+    other_db.create_table(City)
+
+    with DatabaseConnection(db, con_type=ConType.batch):
+        db.insert_record(City())
+        other_db.insert_record(City())
+
+        assert(db.is_batching is True)
+        assert(other_db.is_batching is False)
+
+    assert(len(other_db.select_records(City)) == 1)
+
+    other_db.close()
+
+
+def test_pragma_profile():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH, profile='throughput')
+    db.create_table(City)
+    db.insert_record(City())
+
+    assert(db.fetchone('PRAGMA journal_mode;')[0] == 'wal')
+    assert(db.fetchone('PRAGMA synchronous;')[0] == 1)
+    assert(db.select_record(City, 'id=1').id == 1)
+
+
+def test_custom_pragmas():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH, profile={'cache_size': -1234})
+
+    assert(db.fetchone('PRAGMA cache_size;')[0] == -1234)
+
+
+def test_bulk_load_profile_batch_pragmas():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH, profile='bulk-load')
+    db.create_table(City)
+
+    with db:
+        with DatabaseConnection(db, con_type=ConType.batch):
+            db.insert_record(City())
+            batch_journal_mode = db.fetchone('PRAGMA journal_mode;')[0]
+
+        journal_mode = db.fetchone('PRAGMA journal_mode;')[0]
+
+    assert(batch_journal_mode == 'off')
+    assert(journal_mode == 'delete')
+    assert(len(db.select_records(City)) == 1)
+
+
+def test_bulk_insert_records():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH)
+    db.create_table(City)
+    db.create_table(Person)
+
+    db.insert_record(City())
+
+    cities = [City() for _ in range(1000)]
+    persons = [Person() for _ in range(10)]
+
+    for clone_number, city in enumerate(cities):
+        city.cityName += f'_{clone_number}'
+
+    db.insert_records(cities + persons)
+
+    city_record: City = db.select_record(City, 'id=1001')
+
+    assert([city.id for city in cities] == list(range(2, 1002)))
+    assert([person.id for person in persons] == list(range(1, 11)))
+    assert(city_record.cityName == 'New York_999')
+
+
+def test_bulk_insert_records_in_batch():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH)
+    db.create_table(City)
+
+    with DatabaseConnection(db, con_type=ConType.batch):
+        db.insert_records([City(), City()])
+        db.insert_record(City())
+
+        assert(db.is_batching is True)
+
+    assert(len(db.select_records(City)) == 3)
+
+
+def test_upsert_records_by_pk():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH)
+    db.create_table(City)
+    db.insert_records([City(), City()])
+
+    existing_city: City = db.select_record(City, 'id=2')
+    existing_city.cityName = 'Berlin'
+
+    new_city = City()
+    new_city.id = None
+    new_city.cityName = 'Paris'
+
+    db.upsert_records([existing_city, new_city])
+
+    assert(new_city.id == 3)
+    assert(db.select_record(City, 'id=2').cityName == 'Berlin')
+    assert(db.select_record(City, 'id=3').cityName == 'Paris')
+    assert(len(db.select_records(City)) == 3)
+
+
+def test_upsert_records_by_unique_column():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH)
+    db.create_table(Country)
+
+    denmark = Country()
+    denmark.code = 'DK'
+    denmark.countryName = 'Denmark'
+    db.insert_record(denmark)
+
+    synced_countries = list()
+
+    for code, country_name in (('DK', 'Danmark'), ('SE', 'Sverige')):
+        country = Country()
+        country.code = code
+        country.countryName = country_name
+        synced_countries.append(country)
+
+    db.upsert_records(synced_countries, conflict_column='code')
+
+    sweden: Country = db.select_record(Country, 'code="SE"')
+
+    assert(synced_countries[0].id == 1)
+    assert(synced_countries[1].id == sweden.id)
+    assert(db.select_record(Country, 'id=1').countryName == 'Danmark')
+    assert(len(db.select_records(Country)) == 2)
+
+    stale_denmark = Country()
+    stale_denmark.id = 99
+    stale_denmark.code = 'DK'
+    stale_denmark.countryName = 'Denmark'
+    db.upsert_record(stale_denmark, conflict_column='code')
+
+    assert(stale_denmark.id == 1)
+
+    stale_denmark.countryName = 'Dänemark'
+    db.update_record(stale_denmark)
+
+    assert(db.select_record(Country, 'id=1').countryName == 'Dänemark')
+
+    stale_denmark.id = sweden.id
+    db.upsert_record(stale_denmark, conflict_column='code')
+
+    assert(stale_denmark.id == 1)
+    assert(db.select_record_by_pk(Country, sweden.id).countryName == 'Sverige')
+    assert(len(db.select_records(Country)) == 2)
+
+
+def test_upsert_record_requires_unique_column():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH)
+    db.create_table(Country)
+
+    try:
+        db.upsert_record(Country(), conflict_column='countryName')
+        raised = False
+    except ValueError:
+        raised = True
+
+    assert(raised is True)
+
+
+def test_bulk_update_records():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH)
+    db.create_table(City)
+    db.insert_records([City() for _ in range(100)])
+
+    cities = db.select_records(City)
+
+    for city_record in cities:
+        city_record.cityName = f'City_{city_record.id}'
+
+    db.update_records(cities)
+
+    assert(db.select_record(City, 'id=100').cityName == 'City_100')
+
+
+def test_compiled_statements():
+    statements = City.get_statements()
+
+    assert(City.get_statements() is statements)
+    assert(Person.get_statements() is not statements)
+    assert(statements.insert == 'INSERT INTO City(postalCode, cityName) VALUES (?, ?);')
+    assert(statements.select_by_pk == 'SELECT * FROM City WHERE id=?;')
+
+
+def test_select_record_by_pk():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH)
+    db.create_table(City)
+    db.insert_records([City(), City()])
+
+    city_record: City = db.select_record_by_pk(City, 2)
+
+    assert(city_record.id == 2)
+    assert(db.select_record_by_pk(City, 3) is None)
+
+
+def test_compiled_schema():
+    schema = Person.get_schema()
+
+    assert(schema.col_names == ('id', 'firstName', 'lastName', 'cityId'))
+    assert(Person.get_attr_name_by_index(3) == 'cityId')
+    assert(City.get_col_display_names() == ('id', 'Postal Code', 'City Name'))
+    assert(schema.pk_col_names == ('id',))
+    assert(schema.fk_col_names == ('cityId',))
+    assert(Person().__get_value_by_index__(3) == 0)
+
+    try:
+        schema.col_names = ()
+        immutable = False
+    except AttributeError:
+        immutable = True
+
+    assert(immutable is True)
+
+
+def test_join_table_definitions_per_table_class():
+    assert(list(Person.__join_table_definitions__.keys()) == ['City'])
+    assert(list(ImageTag.__join_table_definitions__.keys()) == ['Image', 'Tag'])
+    assert(TagSelfRef.__join_table_definitions__['TagSelfRef']['table_class'] is TagSelfRef)
+    assert(len(City.__join_table_definitions__) == 0)
+
+
+def test_iter_records():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH)
+    db.create_table(City)
+    db.insert_records([City() for _ in range(250)])
+
+    city_ids = [city_record.id for city_record in db.iter_records(City, condition='id > 50', order_by=['id'], chunk_size=32)]
+
+    assert(city_ids == list(range(51, 251)))
+
+
+def test_iter_records_while_mutating():
+    delete_database()
+
+    # with a rollback journal, the open read cursor blocks writes from other connections.
+    # the persistent connection writes on the same connection, and WAL lets readers and a writer coexist
+    for db in (MrDatabase(DB_PATH).open(), MrDatabase(DB_PATH, profile='throughput')):
+        db.create_table(City)
+        db.insert_records([City() for _ in range(100)])
+
+        for city_record in db.iter_records(City, chunk_size=10):
+            city_record.cityName = f'City_{city_record.id}'
+            db.update_record(city_record)
+
+        assert(db.con is None)
+        assert(db.select_record(City, 'id=100').cityName == 'City_100')
+
+        db.close()
+
+
+def test_iter_records_early_exit():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH)
+    db.create_table(City)
+    db.insert_records([City() for _ in range(100)])
+
+    records = db.iter_records(City, chunk_size=10)
+    first_city: City = next(records)
+    records.close()
+
+    assert(first_city.id == 1)
+    assert(db.con is None)
+
+
+def test_iter_records_connection():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH)
+    db.create_table(City)
+    db.insert_records([City() for _ in range(100)])
+
+    cons = list()
+    new_connection = db.__connection__
+
+    def connection():
+        cons.append(new_connection())
+        return cons[-1]
+
+    db.__connection__ = connection
+
+    # started outside a batch, finished inside one
+    records = db.iter_records(City, chunk_size=10)
+    next(records)
+
+    with DatabaseConnection(db, con_type=ConType.batch):
+        city_record: City = db.select_record(City, 'id=1')
+        city_record.cityName = 'Berlin'
+        db.update_record(city_record)
+        assert(len(list(records)) == 99)
+
+    assert(db.con is None)
+    assert(db.select_record(City, 'id=1').cityName == 'Berlin')
+
+    # two generators, finished out of order
+    first_records = db.iter_records(City, chunk_size=10)
+    second_records = db.iter_records(City, chunk_size=10)
+    next(first_records)
+    next(second_records)
+    second_records.close()
+    first_records.close()
+
+    assert(db.con is None)
+
+    for con in cons:
+        try:
+            con.execute('SELECT 1')
+            closed = False
+        except sqlite3.ProgrammingError:
+            closed = True
+
+        assert(closed)
+
+
+def test_select_page():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH)
+    db.create_table(City)
+
+    cities = [City() for _ in range(25)]
+
+    for city_number, city in enumerate(cities):
+        city.postalCode = 1000 + city_number % 3
+
+    db.insert_records(cities)
+
+    pages = list()
+    token = None
+
+    while True:
+        page, token = db.select_page(City, after=token, order_by=['postalCode'], page_size=10)
+        pages.append(page)
+
+        if token is None:
+            break
+
+    page_ids = [city_record.id for page in pages for city_record in page]
+    expected_ids = [city_record.id for city_record in sorted(cities, key=lambda city: (city.postalCode, city.id))]
+
+    assert([len(page) for page in pages] == [10, 10, 5])
+    assert(page_ids == expected_ids)
+
+
+def test_select_page_descending_with_condition():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH)
+    db.create_table(City)
+    db.insert_records([City() for _ in range(20)])
+
+    first_page, token = db.select_page(City, order_asc=False, page_size=5, condition='id <= 12')
+    second_page, _ = db.select_page(City, after=token, order_asc=False, page_size=5, condition='id <= 12')
+    empty_page, no_token = db.select_page(City, after=(20,), page_size=5)
+
+    assert([city_record.id for city_record in first_page] == [12, 11, 10, 9, 8])
+    assert([city_record.id for city_record in second_page] == [7, 6, 5, 4, 3])
+    assert(len(empty_page) == 0 and no_token is None)
+    assert(empty_page.table_class() is City)
+
+
+def test_select_page_nullable_order_by():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH)
+    db.create_table(City)
+
+    cities = [City() for _ in range(10)]
+
+    for city_number, city in enumerate(cities):
+        city.cityName = None if city_number % 3 == 0 else f'City_{city_number % 4}'
+
+    db.insert_records(cities)
+
+    for order_asc in (True, False):
+        page_ids = list()
+        token = None
+
+        while True:
+            page, token = db.select_page(City, after=token, order_by=['cityName'], order_asc=order_asc, page_size=3)
+            page_ids += [city_record.id for city_record in page]
+
+            if token is None:
+                break
+
+        order = 'ASC' if order_asc else 'DESC'
+        expected_ids = [row[0] for row in db.fetchall(f'SELECT id FROM City ORDER BY cityName {order}, id {order}')]
+
+        assert(len(page_ids) == 10)
+        assert(page_ids == expected_ids)
+
+
+def test_bound_params():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH)
+    db.create_table(City)
+    db.insert_records([City() for _ in range(10)])
+
+    city_record: City = db.select_record(City, 'id=?', (3,))
+    city_record.cityName = "O'Hare"
+    db.update_record(city_record, 'id=:id', {'id': 3})
+
+    db.delete_record(city_record, 'id > ? AND cityName != ?', (8, "O'Hare"))
+
+    cities = db.select_records(City, condition='cityName = :name', params={'name': "O'Hare"})
+    page, _ = db.select_page(City, after=(2,), condition='id <= :last_id', params={'last_id': 5})
+
+    assert(len(cities) == 1 and cities[0].id == 3)
+    assert([city.id for city in page] == [3, 4, 5])
+    assert(len(db.select_records(City)) == 8)
+    assert(db.fetchone('SELECT cityName FROM City WHERE id=?', (3,))[0] == "O'Hare")
+
+
+def test_dirty_tracking():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH)
+    db.create_table(City)
+
+    new_city = City()
+
+    assert(new_city.get_dirty_col_names() == ('id', 'postalCode', 'cityName'))
+
+    db.insert_record(new_city)
+
+    assert(new_city.is_dirty() is False)
+
+    city_record: City = db.select_record_by_pk(City, 1)
+
+    assert(city_record.is_dirty() is False)
+
+    city_record.cityName = 'Aarhus'
+
+    assert(city_record.get_dirty_col_names() == ('cityName',))
+
+
+def test_update_record_writes_changed_columns_only():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH)
+    db.create_table(City)
+    db.insert_record(City())
+
+    city_record: City = db.select_record_by_pk(City, 1)
+    db.__mutate__('UPDATE City SET postalCode=? WHERE id=?', [8000, 1])
+
+    city_record.cityName = 'Aarhus'
+    sql = db.update_record(city_record)
+    skipped_sql = db.update_record(city_record)
+
+    updated_city: City = db.select_record_by_pk(City, 1)
+
+    assert(sql == 'UPDATE City SET cityName=? WHERE id=?;')
+    assert(skipped_sql == '')
+    assert(updated_city.cityName == 'Aarhus' and updated_city.postalCode == 8000)
+
+
+def insert_assets(db: MrDatabase, num_assets: int) -> None:
+    assets = list()
+
+    for asset_number in range(num_assets):
+        asset = Asset()
+        asset.assetName = f'asset_{asset_number}'
+        asset.assetData = bytes([asset_number]) * 1024
+        assets.append(asset)
+
+    db.insert_records(assets)
+
+
+def test_column_projection():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH)
+    db.create_table(City)
+    db.insert_record(City())
+
+    city_record: City = db.select_record(City, 'id=?', (1,), columns=['cityName'])
+
+    assert(city_record.is_loaded('cityName') is True)
+    assert(city_record.is_loaded('postalCode') is False)
+    assert(city_record.postalCode == 9999)
+    assert(city_record.is_loaded('postalCode') is True)
+    assert(city_record.is_dirty() is False)
+
+
+def test_deferred_columns():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH)
+    db.create_table(Asset)
+    insert_assets(db, 3)
+
+    asset: Asset = db.select_record_by_pk(Asset, 2)
+
+    assert(asset.is_loaded('assetData') is False)
+
+    asset.assetName = 'renamed'
+    db.update_record(asset)
+
+    assert(asset.is_loaded('assetData') is False)
+    assert(asset.assetData == bytes([1]) * 1024)
+    assert(db.select_record_by_pk(Asset, 2, columns=['assetData', 'assetName']).assetName == 'renamed')
+
+
+def test_load_deferred_columns_for_records():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH)
+    db.create_table(Asset)
+    insert_assets(db, 20)
+
+    assets = db.select_records(Asset)
+    assets.load_columns(db)
+
+    assert(all(asset.is_loaded('assetData') for asset in assets))
+    assert(assets.last().__dict__['assetData'] == bytes([19]) * 1024)
+    assert(assets.first().clone().assetData == bytes([0]) * 1024)
+
+
+def test_blob_streaming():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH)
+    db.create_table(Asset)
+
+    asset_data = bytes(range(256)) * 12000
+    asset = Asset()
+    db.insert_record(asset)
+
+    md5 = db.write_blob(asset, 'assetData', io.BytesIO(asset_data), md5_col_name='md5', chunk_size=65536)
+
+    assert(md5 == hashlib.md5(asset_data).hexdigest())
+    assert(asset.md5 == md5 and asset.is_dirty() is False)
+    assert(asset.is_loaded('assetData') is False)
+
+    with db.open_blob(asset, 'assetData') as blob:
+        blob.seek(256)
+        assert(blob.read(4) == bytes([0, 1, 2, 3]))
+        assert(len(blob) == len(asset_data))
+
+    asset_file = io.BytesIO()
+
+    assert(db.read_blob(asset, 'assetData', asset_file, chunk_size=65536) == md5)
+    assert(asset_file.getvalue() == asset_data)
+    assert(db.select_record_by_pk(Asset, 1).md5 == md5)
+    assert(Asset.md5_file_object(io.BytesIO(asset_data)) == md5)
+
+
+def test_write_blob_encoded_column():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH)
+    db.create_table(Document)
+    db.create_table(CatalogAsset)
+
+    document = Document()
+    document.attachment = bytes(range(256)) * 4
+    db.insert_record(document)
+
+    catalog_asset = CatalogAsset()
+    catalog_asset.assetData = bytes([7]) * 512
+    db.insert_record(catalog_asset)
+
+    for record_object, col_name in ((document, 'attachment'), (catalog_asset, 'assetData')):
+        try:
+            db.write_blob(record_object, col_name, io.BytesIO(bytes(1024)))
+            assert False
+        except ValueError:
+            pass
+
+    assert(db.select_record_by_pk(Document, 1).attachment == bytes(range(256)) * 4)
+    assert(db.select_record_by_pk(CatalogAsset, 1).assetData == bytes([7]) * 512)
+    assert(db.fetchone('SELECT refCount FROM BlobStore;') == (1,))
+
+
+def test_blob_streaming_unavailable():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH)
+    db.create_table(Asset)
+
+    asset = Asset()
+    asset.assetData = bytes([1]) * 64
+    db.insert_record(asset)
+
+    blob_streaming = mrdatabase.BLOB_STREAMING
+    mrdatabase.BLOB_STREAMING = False
+
+    try:
+        db.write_blob(asset, 'assetData', io.BytesIO(bytes(64)))
+        assert False
+    except NotImplementedError:
+        pass
+    finally:
+        mrdatabase.BLOB_STREAMING = blob_streaming
+
+    assert(db.select_record_by_pk(Asset, 1).assetData == bytes([1]) * 64)
+
+
+def test_compressed_columns():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH)
+    db.create_table(Document)
+
+    document = Document()
+    document.body = 'All work and no play makes Jack a dull boy. ' * 100
+    document.attachment = bytes(100)
+    db.insert_record(document)
+
+    stored_body, stored_attachment = db.fetchone('SELECT body, attachment FROM Document WHERE id=?', (document.id,))
+
+    assert(stored_body[0] == 2 and len(stored_body) < len(document.body))
+    assert(stored_attachment == b'\x00' + bytes(100))
+
+    document = db.select_record_by_pk(Document, document.id)
+
+    assert(document.is_loaded('body') and 'body' not in document.__dict__)
+    assert(document.body == 'All work and no play makes Jack a dull boy. ' * 100)
+    assert(document.attachment == bytes(100) and document.is_dirty() is False)
+
+    document.attachment = bytes(range(256)) * 4 + bytes(4096)
+    db.update_record(document)
+
+    assert(db.fetchone('SELECT attachment FROM Document')[0][0] == 1)
+    assert(db.select_records(Document).first().attachment == bytes(range(256)) * 4 + bytes(4096))
+
+    document = Document()
+    db.insert_record(document)
+
+    assert(db.select_record_by_pk(Document, document.id).body is None)
+
+
+def test_dedup_blob_store():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH)
+    db.create_table(CatalogAsset)
+
+    assets = list()
+
+    for asset_number in range(6):
+        asset = CatalogAsset()
+        asset.assetName = f'asset_{asset_number}'
+        asset.assetData = bytes([asset_number % 2]) * 4096
+        assets.append(asset)
+
+    db.insert_records(assets)
+
+    assert(db.fetchall('SELECT refCount, byteSize FROM BlobStore ORDER BY refCount') == [(3, 4096), (3, 4096)])
+    assert(db.fetchone('SELECT assetData FROM CatalogAsset WHERE id=1')[0] == Column.content_hash(bytes(4096)))
+
+    asset = db.select_record_by_pk(CatalogAsset, 2)
+
+    assert(asset.assetData == bytes([1]) * 4096 and asset.is_dirty() is False)
+
+    asset.assetData = b'unique'
+    db.update_record(asset)
+    db.delete_record(db.select_record_by_pk(CatalogAsset, 1))
+
+    assert(db.fetchall('SELECT refCount FROM BlobStore ORDER BY refCount') == [(1,), (2,), (2,)])
+    assert(db.select_records(CatalogAsset).first().assetData == b'unique')
+
+    for asset in db.select_records(CatalogAsset, 'assetData=?', params=(Column.content_hash(bytes(4096)),)):
+        db.delete_record(asset)
+
+    content_hashes = db.store_blobs([b'ingested', b'ingested'])
+
+    assert(content_hashes == [Column.content_hash(b'ingested')] * 2)
+    assert(db.collect_blobs() == 2)
+    assert(db.fetchone('SELECT count(*) FROM BlobStore')[0] == 2)
+
+    db.drop_table(CatalogAsset)
+
+    assert(db.collect_blobs() == 2)
+
+
+def test_aggregates():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH)
+    db.create_table(City)
+
+    cities = list()
+
+    for city_number in range(10):
+        city = City()
+        city.postalCode = 1000 + city_number
+        city.cityName = 'Berlin' if city_number % 2 else 'Vienna'
+        cities.append(city)
+
+    db.insert_records(cities)
+
+    assert(db.count(City) == 10)
+    assert(db.count(City, 'cityName=?', ('Berlin',)) == 5)
+    assert(db.exists(City, 'postalCode > :code', {'code': 1008}) is True)
+    assert(db.exists(City, 'postalCode > ?', (1009,)) is False)
+
+    assert(db.aggregate(City, {'lowest': ('min', 'postalCode'), 'cities': ('count', '*')}) == {'lowest': 1000, 'cities': 10})
+    assert(db.aggregate(City, {'highest': ('MAX', 'postalCode')}, group_by=['cityName']) ==
+           [{'cityName': 'Berlin', 'highest': 1009}, {'cityName': 'Vienna', 'highest': 1008}])
+
+    for aggregates in ({'highest': ('median', 'postalCode')}, {'highest': ('max', 'unknownColumn')}, {'x; DROP': ('max', 'id')}):
+        try:
+            db.aggregate(City, aggregates)
+            assert False
+        except ValueError:
+            pass
+
+    records = db.select_records(City, 'cityName=?', order_by=['postalCode'], limit=3, params=('Vienna',))
+
+    assert(records.max('postalCode') == 1004 and records.min('postalCode') == 1000)
+    assert(records.sum('postalCode') == 3006)
+
+    records.first().postalCode = 2000
+
+    assert(records.max('postalCode') == 2000)
+
+    records.pop(0)
+
+    assert(records.sum('postalCode') == 2006)
+    assert(Records([], City).max('postalCode') is None)
+
+    # the records held are aggregated, not the table as it is now
+    db.__mutate__('UPDATE City SET postalCode=9000 WHERE id=?', (records.last().id,))
+    db.insert_record(City())
+
+    assert(records.max('postalCode') == 1004 and records.sum('postalCode') == 2006)
+
+    projected = db.select_records(City, 'cityName=?', columns=['cityName'], params=('Vienna',))
+    assert(projected.max('postalCode') == 9000)
+
+
+def test_prefetch_join_tables():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH)
+    db.create_table(City)
+    db.create_table(Person)
+
+    cities = [City() for _ in range(3)]
+    db.insert_records(cities)
+
+    persons = list()
+
+    for person_number in range(1200):
+        person = Person()
+        person.firstName = f'person_{person_number}'
+        person.cityId = cities[person_number % 3].id if person_number % 4 else None
+        persons.append(person)
+
+    db.insert_records(persons)
+
+    persons = db.select_records(Person, prefetch=['City'])
+    city = persons[1].get_join_tables()['City']
+
+    assert(city.id == 2 and persons[7].get_join_tables()['City'] is city)
+    assert(persons[0].get_join_tables()['City'] is None)
+    assert(persons[1].select_join_record(db, 'City') is city)
+    assert(Person().get_join_tables() == {})
+
+    persons[1].cityId = 3
+    db.update_record(persons[1])
+    moved_city = persons[1].select_join_record(db, 'City')
+
+    assert(moved_city.id == 3 and persons[1].get_join_tables()['City'] is moved_city)
+    assert(persons[0].select_join_record(db, 'City') is None)
+
+    persons = db.select_records(Person, limit=10)
+    persons.fetch_join_tables(db)
+
+    assert(persons[9].get_join_tables()['City'].id == 1)
+
+    try:
+        db.select_records(Person, prefetch=['Country'])
+        assert False
+    except ValueError:
+        pass
+
+
+def test_session_identity_map():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH)
+    db.create_table(City)
+    db.create_table(Person)
+
+    session = Session(db)
+
+    city = City()
+    session.insert_record(city)
+
+    assert(session.get(City, city.id) is city and session.hits == 1)
+    assert(session.select_record(City, 'id=?', (city.id,)) is city)
+
+    db.insert_records([City() for _ in range(3)])
+
+    cities = session.select_records(City)
+
+    assert(cities.first() is city and len(session) == 4)
+    assert(session.get(City, 2) is cities[1])
+
+    person = Person()
+    person.cityId = 2
+    session.insert_record(person)
+
+    assert(session.select_join_record(person, 'City') is cities[1])
+
+    updated_city = db.select_record_by_pk(City, 3)
+    updated_city.cityName = 'Berlin'
+    session.update_record(updated_city)
+
+    assert(session.get(City, 3) is updated_city)
+
+    session.delete_record(updated_city)
+
+    assert(updated_city not in session and session.get(City, 3) is None)
+
+    session.clear()
+
+    assert(session.get(City, 1) is not city and session.misses == 2)
+
+
+def test_session_write_by_condition():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH)
+    db.create_table(City)
+    db.create_table(Person)
+    db.insert_records([City() for _ in range(4)])
+
+    session = Session(db)
+    cities = session.select_records(City)
+    session.get(City, 1)
+    person = session.get(Person, 1)
+
+    cities[0].cityName = 'Berlin'
+    cities[1].cityName = 'Berlin'
+    session.update_record(cities[0])
+    session.update_record(cities[1], 'id=?', (2,))
+
+    assert(cities[0] not in session and cities[1] not in session)
+    assert(session.get(City, 2).cityName == 'Berlin')
+
+    session.delete_record(cities[0], 'cityName=?', ('Berlin',))
+
+    assert(session.get(City, 1) is None and session.get(City, 2) is None)
+    assert(session.get(City, 3) is not cities[2] and session.get(City, 3).id == 3)
+    assert(person is None and len(session) == 1)
+
+
+def test_session_lru_eviction():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH)
+    db.create_table(City)
+    db.insert_records([City() for _ in range(5)])
+
+    session = Session(db, max_size=2)
+
+    first_city = session.get(City, 1)
+    session.get(City, 2)
+    session.get(City, 1)
+    session.get(City, 3)
+
+    assert(len(session) == 2 and first_city in session)
+    assert(session.get(City, 1) is first_city)
+    assert(session.hits == 2 and session.misses == 3)
+
+
+def test_query_cache():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH, query_cache=QueryCache(max_size=2))
+    db.create_table(City)
+    db.create_table(Person)
+    db.insert_records([City() for _ in range(3)])
+
+    cities = db.select_records(City)
+    cities_again = db.select_records(City)
+
+    assert(len(cities_again) == 3 and cities_again.first() is not cities.first())
+    assert(db.query_cache.hits == 1 and db.query_cache.misses == 1)
+
+    db.select_record_by_pk(City, 1)
+    db.fetchall('SELECT * FROM Person')
+
+    assert(db.query_cache.evictions == 1 and len(db.query_cache) == 2)
+
+    db.select_record_by_pk(City, 1)
+
+    assert(db.query_cache.hits == 2)
+
+    city = db.select_record_by_pk(City, 1)
+    city.cityName = 'Berlin'
+    db.update_record(city)
+
+    assert(db.select_record_by_pk(City, 1).cityName == 'Berlin')
+    assert(len(db.query_cache) == 2)
+
+    db.insert_records([City()])
+
+    assert(db.count(City) == 4)
+
+    db.__mutate__('DELETE FROM City WHERE id=?', (4,))
+
+    assert(db.count(City) == 3)
+    assert(db.query_cache.stats()['hits'] == 3)
+
+
+def test_query_cache_table_names():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH, query_cache=QueryCache())
+    db.create_table(City)
+    db.create_table(Person)
+    db.insert_records([City() for _ in range(2)])
+
+    join_sql = 'SELECT COUNT(*) FROM City c, Person p WHERE p.cityId = c.id'
+
+    assert(db.fetchone(join_sql) == (0,))
+
+    person = Person()
+    person.cityId = 1
+    db.insert_record(person)
+
+    assert(db.fetchone(join_sql) == (1,))
+    assert(db.fetchall('SELECT cityName FROM "City" WHERE id=1') == [('New York',)])
+
+    city = db.select_record_by_pk(City, 1)
+    city.cityName = 'Berlin'
+    db.update_record(city)
+
+    assert(db.fetchall('SELECT cityName FROM "City" WHERE id=1') == [('Berlin',)])
+
+    entries = len(db.query_cache)
+    db.fetchone('SELECT random()')
+
+    assert(len(db.query_cache) == entries)
+    assert(QueryCache.table_names('SELECT * FROM (SELECT * FROM City) AS c, main.[Person]') == {'city', 'person'})
+
+
+def test_query_cache_blob_write():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH, query_cache=QueryCache())
+    db.create_table(Asset)
+
+    asset = Asset()
+    asset.assetData = bytes([1]) * 64
+    db.insert_record(asset)
+
+    assert(db.fetchall('SELECT assetData FROM Asset') == [(bytes([1]) * 64,)])
+
+    db.write_blob(asset, 'assetData', io.BytesIO(bytes([2]) * 64))
+
+    assert(db.fetchall('SELECT assetData FROM Asset') == [(bytes([2]) * 64,)])
+
+    with db.open_blob(asset, 'assetData', readonly=False) as blob:
+        blob.write(bytes([3]) * 64)
+
+    assert(db.fetchall('SELECT assetData FROM Asset') == [(bytes([3]) * 64,)])
+
+
+def test_query_cache_ttl():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH, query_cache=QueryCache(ttl=0.01))
+    db.create_table(City)
+
+    db.count(City)
+    db.count(City)
+    time.sleep(0.02)
+    db.count(City)
+
+    assert(db.query_cache.hits == 1 and db.query_cache.misses == 2 and db.query_cache.evictions == 1)
+
+
+def test_change_tracking():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH, track_changes=True)
+    db.create_table(City)
+    db.create_table(Person)
+
+    city_version = db.table_version(City)
+
+    db.insert_records([City() for _ in range(3)])
+    db.__mutate__('DELETE FROM City WHERE id=?', (1,))
+
+    assert(db.table_version(City) == city_version + 4)
+    assert(db.table_version(Person) == 0)
+    assert(MrDatabase(DB_PATH).table_version(Tag) is None)
+
+
+def test_cross_process_cache_invalidation():
+    delete_database()
+
+    for track_changes in (False, True):
+        delete_database()
+
+        reader: MrDatabase = MrDatabase(DB_PATH, query_cache=QueryCache(sync_interval=0), track_changes=track_changes)
+        writer: MrDatabase = MrDatabase(DB_PATH, track_changes=track_changes)
+
+        writer.create_table(City)
+        writer.create_table(Person)
+
+        with reader:
+            assert(reader.count(City) == 0 and reader.count(Person) == 0)
+            assert(reader.count(City) == 0 and reader.query_cache.hits == 1)
+
+            writer.insert_record(City())
+
+            assert(reader.count(City) == 1)
+            assert(reader.count(Person) == 0)
+            assert(reader.query_cache.hits == (2 if track_changes else 1))
+
+            data_version = reader.data_version()
+            writer.insert_record(Person())
+
+            assert(reader.data_version() != data_version)
+
+
+def test_query_cache_sync_interval():
+    delete_database()
+
+    reader: MrDatabase = MrDatabase(DB_PATH, query_cache=QueryCache(sync_interval=60), track_changes=True)
+    writer: MrDatabase = MrDatabase(DB_PATH, track_changes=True)
+    writer.create_table(City)
+
+    assert(reader.count(City) == 0)
+
+    connections = list()
+    connect = reader.__connection__
+    reader.__connection__ = lambda: connections.append(1) or connect()
+
+    # a hit within the sync interval costs no connection and no query
+    for _ in range(10):
+        assert(reader.count(City) == 0)
+
+    assert(connections == [] and reader.query_cache.hits == 10)
+
+    writer.insert_record(City())
+    assert(reader.count(City) == 0)
+
+    reader.query_cache.sync_interval = 0
+    assert(reader.count(City) == 1)
+
+
+def test_compact_table():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH)
+    db.create_table(CompactAsset)
+
+    asset = CompactAsset()
+    asset.assetData = bytes(1024)
+
+    assert(not hasattr(asset, '__dict__') and isinstance(CompactAsset.assetName, Column))
+    assert(asset.get_dirty_col_names() == ('id', 'assetName', 'assetData'))
+
+    db.insert_record(asset)
+    assert(not asset.is_dirty() and not hasattr(asset, '__state__'))
+
+    try:
+        asset.assetSize = 1024
+        assert False
+    except AttributeError:
+        pass
+
+    asset = db.select_record_by_pk(CompactAsset, 1)
+    assert(asset.assetName == 'asset' and not asset.is_loaded('assetData'))
+    assert(list(asset.get_attributes()) == ['id', 'assetName'])
+    assert(asset.assetData == bytes(1024) and asset.is_loaded('assetData'))
+
+    asset.assetName = 'renamed'
+    db.update_record(asset)
+
+    clone = asset.clone()
+    assert(clone.assetName == 'renamed' and clone.assetData == bytes(1024))
+    assert(db.select_record_by_pk(CompactAsset, 1).assetName == 'renamed')
+
+
+class Playlist(Table):
+    id = Column(DataTypes.integer, pk=True)
+    playlistName = Column(DataTypes.varchar(40), default='playlist')
+
+    def __init__(self):
+        super().__init__()
+
+        self.maxLength: int = 100
+        self.tracks: List[str] = list()
+
+
+def test_record_factory():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH)
+    db.create_table(City)
+    db.create_table(Playlist)
+
+    db.insert_records([City() for _ in range(3)])
+    db.insert_records([Playlist() for _ in range(2)])
+
+    cities = db.select_records(City, columns=['cityName'])
+    assert(not cities.first().is_dirty() and not cities.first().is_loaded('postalCode'))
+    assert(cities.first().postalCode == 9999)
+
+    playlists = db.select_records(Playlist)
+    assert(playlists.first().maxLength == 100 and not playlists.first().is_dirty())
+    assert(playlists.first().tracks is not playlists.last().tracks)
+
+    create = City.get_record_factory(('id', 'cityName'))
+    assert(create is City.get_record_factory(('id', 'cityName')))
+
+    city = create((7, 'Hamburg'))
+    assert(city.id == 7 and city.cityName == 'Hamburg' and not city.is_loaded('postalCode'))
+
+
+def test_select_columns():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH)
+    db.create_table(City)
+    db.create_table(Document)
+
+    cities = [City() for _ in range(5)]
+    cities[3].postalCode = None
+    cities[4].cityName = 'Berlin'
+    db.insert_records(cities)
+
+    columns = db.select_columns(City, ['id', 'cityName'], 'id > ?', params=(1,), chunk_size=2)
+    assert(list(columns) == ['id', 'cityName'])
+    assert(list(columns['id']) == [2, 3, 4, 5])
+    assert(list(columns['cityName']) == ['New York'] * 3 + ['Berlin'])
+
+    postal_codes = db.select_columns(City)['postalCode']
+    assert(list(postal_codes[:3]) == [9999] * 3 and postal_codes[3] != postal_codes[3])
+
+    # an integer column holding NULL and text is returned as selected
+    db.__mutate__('UPDATE City SET postalCode=? WHERE id=?', ('unknown', 5))
+    assert(list(db.select_columns(City, ['postalCode'], chunk_size=2)['postalCode']) == [9999] * 3 + [None, 'unknown'])
+
+    for table_class, columns in ((City, ['population']), (Document, ['body'])):
+        try:
+            db.select_columns(table_class, columns)
+            assert False
+        except ValueError:
+            pass
+
+
+def test_row_records():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH)
+    db.create_table(City)
+    db.create_table(Person)
+
+    cities = [City() for _ in range(4)]
+
+    for city, postal_code in zip(cities, (3000, 1000, 4000, 2000)):
+        city.postalCode = postal_code
+
+    db.insert_records(cities)
+
+    person = Person()
+    person.cityId = 2
+    db.insert_record(person)
+
+    records = db.select_records(City, lazy=True)
+    assert(isinstance(records, RowRecords) and len(records) == 4)
+    assert(records.value(1, 'postalCode') == 1000 and records.column('id') == [1, 2, 3, 4])
+    assert(len(records.__cache__) == 0)
+
+    records.sort(1)
+    assert(records.column('postalCode') == [1000, 2000, 3000, 4000])
+    assert(records.first().id == 2 and records.first() is records[0] and records.last().id == 3)
+
+    records.cache_size = 2
+    city = records[1]
+    city.cityName = 'Berlin'
+    assert(records.column('cityName')[1] == 'Berlin')
+    assert(records.max('postalCode') == 4000 and records.min('cityName') == 'Berlin')
+
+    assert(records.index(city) == 1)
+    records.remove(city)
+    records.append(City())
+    assert(len(records) == 4 and records.last().postalCode == 9999)
+    assert(records.pop().__class__ is City and records.pop(0).id == 2)
+
+    persons = db.select_records(Person, lazy=True, prefetch=['City'])
+    assert(persons[0].get_join_tables()['City'].postalCode == 1000)
+
+
+def test_records_index():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH)
+    db.create_table(Person)
+
+    persons = [Person() for _ in range(6)]
+
+    for person, city_id in zip(persons, (3, 1, 2, 1, None, 3)):
+        person.cityId = city_id
+
+    db.insert_records(persons)
+
+    for lazy in (False, True):
+        records = db.select_records(Person, lazy=lazy)
+        records.create_index('id', unique=True)
+        records.create_index('cityId', ordered=True)
+
+        assert(records.get_by('id', 4).cityId == 1 and records.get_by('id', 7) is None)
+        assert([person.id for person in records.filter_by('cityId', 1)] == [2, 4])
+        assert([person.id for person in records.range('cityId', 2)] == [3, 1, 6])
+        assert([person.id for person in records.range('cityId', 1, 3)] == [2, 4, 3])
+        assert([person.id for person in records.range('firstName')] == [])
+
+        person = Person()
+        person.id = 7
+        person.cityId = 2
+        records.append(person)
+
+        records.remove(records.get_by('id', 3))
+        assert(records.get_by('id', 3) is None)
+        assert([person.id for person in records.range('cityId', 2, 3)] == [7])
+
+        records.pop(0)
+        assert(records.filter_by('cityId', 3)[0].id == 6)
+
+        try:
+            records.append(person)
+            assert False
+        except ValueError:
+            pass
+
+        assert(len(records) == 5 and records.last() is person)
+
+
+def test_bulk_write_rollback():
+    delete_database()
+
+    db: MrDatabase = MrDatabase(DB_PATH)
+    db.create_table(Country)
+
+    countries = [Country() for _ in range(4)]
+
+    for country, code in zip(countries, ('AA', 'BB', 'AA', 'CC')):
+        country.code = code
+
+    try:
+        db.insert_records(countries)
+        assert False
+    except sqlite3.IntegrityError:
+        pass
+
+    assert(db.count(Country) == 0)
+    assert(all(country.id is None and country.is_dirty() for country in countries))
+
+    countries[2].code = 'DD'
+    db.insert_records(countries)
+    assert([country.id for country in countries] == [1, 2, 3, 4])
+
+    countries[0].countryName = 'Atlantis'
+    countries[1].code = 'CC'
+
+    try:
+        db.update_records(countries)
+        assert False
+    except sqlite3.IntegrityError:
+        pass
+
+    assert(db.select_record_by_pk(Country, 1).countryName is None)
+    assert(countries[0].get_dirty_col_names() == ('countryName',) and countries[1].get_dirty_col_names() == ('code',))
+
+
 if __name__ == '__main__':
     test_create_junction_table()
 